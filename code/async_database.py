@@ -0,0 +1,262 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import psycopg
+from psycopg.rows import dict_row, tuple_row
+from psycopg_pool import AsyncConnectionPool
+
+from importer import take_batch
+from migrate import migrate
+from storage import Storage
+from instrumentation import explain_query, observe_query, record_plan, should_explain
+from database import (
+    DATABASE_URL,
+    DB_POOL_MIN,
+    DB_POOL_MAX,
+    DB_POOL_MAX_IDLE,
+    UPSERT_STUDENT,
+    UPSERT_STUDENTS_BULK,
+    CREATE_IMPORT_STAGING,
+    COPY_IMPORT_STAGING,
+    MERGE_IMPORT_STAGING,
+    EXPORT_STUDENTS,
+    DELETE_STUDENT,
+    UPDATE_STUDENT_NAME,
+    build_students_query,
+    bulk_upsert_params,
+    build_find_query,
+)
+
+
+class AsyncDatabase(Storage):
+    """Async variant of Database backed by psycopg 3.
+
+    Has the same method surface as Database, but every method is a coroutine,
+    so a slow query only suspends the handler that issued it instead of
+    blocking the whole event loop.
+
+    With pooled=True every call checks out its own connection from a
+    psycopg_pool pool, so concurrent updates run their queries in parallel.
+    Otherwise calls take turns on the one shared connection, so concurrent
+    handlers never share a transaction.
+    """
+
+    def __init__(
+        self,
+        pooled: bool = False,
+        min_size: int = DB_POOL_MIN,
+        max_size: int = DB_POOL_MAX,
+        max_idle: float = DB_POOL_MAX_IDLE,
+    ):
+        if not DATABASE_URL:
+            raise ValueError("DATABASE_URL is not set. Cannot connect to database.")
+        self.conn = None
+        self.pool = None
+        # Serializes calls on the shared connection in non-pooled mode
+        self._conn_lock = asyncio.Lock()
+        if pooled:
+            self.pool = AsyncConnectionPool(
+                DATABASE_URL,
+                min_size=min_size,
+                max_size=max_size,
+                max_idle=max_idle,
+                kwargs={"row_factory": dict_row},
+                open=False,
+            )
+
+    async def connect(self):
+        """Opens the connection (or pool) and migrates the schema.
+        Must be awaited (e.g. from Application.post_init) before any query."""
+        if self.pool is not None:
+            await self.pool.open(wait=True)
+        else:
+            self.conn = await psycopg.AsyncConnection.connect(
+                DATABASE_URL, row_factory=dict_row
+            )
+        await self.init_db()
+
+    @asynccontextmanager
+    async def _connection(self):
+        """Yields a connection: checked out of the pool in pooled mode,
+        otherwise the single shared connection, held for the whole call."""
+        if self.pool is not None:
+            # The pool rolls back on error and discards broken connections
+            async with self.pool.connection() as conn:
+                yield conn
+            return
+        # Without the lock, one handler's commit or rollback would end another
+        # handler's transaction (e.g. dropping /import's ON COMMIT DROP table)
+        async with self._conn_lock:
+            try:
+                yield self.conn
+            except Exception:
+                if not self.conn.closed:
+                    await self.conn.rollback()
+                raise
+
+    def pool_stats(self) -> dict:
+        """Returns pool usage statistics, or an empty dict if not pooled.
+        Uses the same keys as ConnectionPool.stats()."""
+        if self.pool is None:
+            return {}
+        stats = self.pool.get_stats()
+        return {
+            "min_size": stats["pool_min"],
+            "max_size": stats["pool_max"],
+            "size": stats["pool_size"],
+            "in_use": stats["pool_size"] - stats["pool_available"],
+            "idle": stats["pool_available"],
+            "waiting": stats["requests_waiting"],
+            "checkouts": stats.get("requests_num", 0),
+            "checkout_wait_ms_total": stats.get("requests_wait_ms", 0),
+        }
+
+    async def _execute(self, cur, query, params=None):
+        """Executes a query, timing it for the slow-query log. A sample of slow
+        SELECTs is re-run under EXPLAIN and the plan kept for /slowplans."""
+        start = time.perf_counter()
+        try:
+            await cur.execute(query, params)
+        finally:
+            seconds = time.perf_counter() - start
+            slow = observe_query(query, params, seconds)
+        if slow and should_explain(query):
+            await self._explain(cur.connection, query, params, seconds)
+
+    async def _explain(self, conn, query, params, seconds: float):
+        """Captures the plan of a slow query. Runs in a savepoint on a separate
+        cursor, so a failure can't abort the caller's transaction or results."""
+        try:
+            async with conn.cursor(row_factory=tuple_row) as cur:
+                await cur.execute("SAVEPOINT auto_explain")
+                try:
+                    await cur.execute(explain_query(query), params)
+                    plan_lines = [row[0] for row in await cur.fetchall()]
+                finally:
+                    await cur.execute("ROLLBACK TO SAVEPOINT auto_explain")
+            record_plan(query, params, seconds, plan_lines)
+        except psycopg.Error as e:
+            print(f"Could not capture plan for slow query: {e}")
+
+    async def init_db(self):
+        """Applies pending schema migrations (see migrate.py).
+        The runner is synchronous, so it runs in a worker thread."""
+        await asyncio.to_thread(migrate, DATABASE_URL)
+
+    async def add_student(self, user_id: int, number: str, name: str):
+        """Adds or updates a student record for a user."""
+        async with self._connection() as conn:
+            async with conn.cursor() as cur:
+                await self._execute(cur, UPSERT_STUDENT, (user_id, number, name))
+            await conn.commit()
+
+    async def add_students_bulk(self, user_id: int, rows) -> int:
+        """Adds or updates many (number, name) student records for a user
+        in a single statement and transaction. Returns the number of rows written."""
+        params = bulk_upsert_params(user_id, rows)
+        if not params[1]:
+            return 0
+        async with self._connection() as conn:
+            async with conn.cursor() as cur:
+                await self._execute(cur, UPSERT_STUDENTS_BULK, params)
+                written = cur.rowcount
+            await conn.commit()
+        return written
+
+    async def import_students(self, user_id: int, rows) -> dict:
+        """Streams (number, name) rows into a staging table with COPY and merges
+        them into the user's students in one transaction.
+        Returns {"inserted": ..., "updated": ...}.
+
+        rows is usually a lazy CSV/XLSX reader, so it's consumed in batches
+        on a worker thread; parsing a big file never blocks the event loop."""
+        rows = iter(rows)
+        async with self._connection() as conn:
+            async with conn.cursor() as cur:
+                await self._execute(cur, CREATE_IMPORT_STAGING)
+                async with cur.copy(COPY_IMPORT_STAGING) as copy:
+                    while batch := await asyncio.to_thread(take_batch, rows):
+                        for row in batch:
+                            await copy.write_row(row)
+                await self._execute(cur, MERGE_IMPORT_STAGING, (user_id,))
+                result = await cur.fetchone()
+            await conn.commit()
+        return {"inserted": result["inserted"], "updated": result["updated"]}
+
+    async def export_students(self, user_id: int, out):
+        """Streams the user's students as CSV (with header) into the binary file object out."""
+        async with self._connection() as conn:
+            async with conn.cursor() as cur:
+                async with cur.copy(EXPORT_STUDENTS, (user_id,)) as copy:
+                    async for data in copy:
+                        out.write(data)
+
+    async def get_students(
+        self,
+        user_id: int,
+        order_by: str = "student_number",
+        limit: int | None = None,
+        after: str | None = None,
+        before: str | None = None,
+    ):
+        """Retrieves students for a given user, ordered as specified.
+        For keyset pagination pass a limit and a student_number cursor as
+        after (next page) or before (previous page)."""
+        query, params, reverse = build_students_query(
+            user_id, order_by, limit, after, before
+        )
+        async with self._connection() as conn:
+            async with conn.cursor() as cur:
+                await self._execute(cur, query, params)
+                rows = await cur.fetchall()
+        if reverse:
+            rows.reverse()  # Seeking backwards reads in descending order
+        return rows
+
+    async def find_students(
+        self,
+        user_id: int,
+        query: str,
+        order_by: str = "student_number",
+        mode: str = "substring",
+        limit: int | None = None,
+    ):
+        """Finds students by number or name, ordered as specified.
+        mode is one of FIND_MODES: "substring" (default), "similarity" for
+        typo-tolerant ranked matches, or "fulltext" to match all query words."""
+        sql_query, params = build_find_query(user_id, query, order_by, mode, limit)
+        async with self._connection() as conn:
+            async with conn.cursor() as cur:
+                await self._execute(cur, sql_query, params)
+                return await cur.fetchall()
+
+    async def delete_student(self, user_id: int, student_number: str) -> bool:
+        """Deletes a specific student for a user by their number.
+        Returns True if a student was deleted, False otherwise."""
+        async with self._connection() as conn:
+            async with conn.cursor() as cur:
+                await self._execute(cur, DELETE_STUDENT, (user_id, student_number))
+                deleted_count = cur.rowcount
+            await conn.commit()
+        return deleted_count > 0
+
+    async def update_student_name(
+        self, user_id: int, student_number: str, new_name: str
+    ) -> bool:
+        """Updates the name of a specific student for a user by their number.
+        Returns True if a student was updated, False otherwise."""
+        async with self._connection() as conn:
+            async with conn.cursor() as cur:
+                await self._execute(
+                    cur, UPDATE_STUDENT_NAME, (new_name, user_id, student_number)
+                )
+                updated_count = cur.rowcount
+            await conn.commit()
+        return updated_count > 0
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+        if self.conn:
+            await self.conn.close()
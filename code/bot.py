@@ -1,14 +1,20 @@
 import os
 import asyncio  # Import asyncio for proper async execution if needed later
+import gzip
+import tempfile
+import time
 from dotenv import load_dotenv, dotenv_values
 from telegram.error import BadRequest
 from telegram import (
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
 )  # Add button imports
 from telegram.constants import ParseMode  # Import ParseMode for formatting
 from telegram.ext import (
+    Application,
     ApplicationBuilder,
     CommandHandler,
     ContextTypes,
@@ -16,10 +22,33 @@ from telegram.ext import (
     MessageHandler,
     filters,
     CallbackQueryHandler,
+    InlineQueryHandler,
 )
 
-# Import the Database class from your new file
-from database import Database
+# Storage backends are chosen by config (handlers await every query)
+from storage import create_storage
+from cache import (
+    INLINE_CACHE_SIZE,
+    INLINE_CACHE_TTL,
+    MESSAGE_HASH_CACHE_SIZE,
+    MESSAGE_HASH_TTL,
+    PAGE_CACHE_SIZE,
+    CachedDatabase,
+    RosterCache,
+)
+from instrumentation import SLOW_PLANS, InstrumentedStorage, register_stats_collector
+from metrics import REGISTRY, start_metrics_server
+from snapshot import SNAPSHOT_MAX_ROWS, RosterSnapshot, SnapshotStore
+from importer import (
+    MAX_NUMBER_LENGTH,
+    clean_rows,
+    is_valid_number,
+    iter_csv_rows,
+    iter_xlsx_rows,
+)
+from webhook import run_webhook
+from update_processor import PerUserUpdateProcessor
+from rate_limiter import OutgoingRateLimiter
 
 
 # Load environment variables from .env file
@@ -33,8 +62,76 @@ if not BOT_TOKEN:
     raise ValueError("TELEGRAM_TOKEN not found in environment variables.")
 
 
+# Port for the Prometheus /metrics endpoint (disabled when not set)
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+# Updates handled at the same time; each user's updates still run in order.
+# Handlers beyond the DB pool size (DB_POOL_MAX) just wait for a connection.
+# Updates queued behind the same user's earlier one don't take a slot.
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "16"))
+
+# Where user_data and conversation states survive restarts: "postgres" or "none".
+# Defaults to "postgres" when the roster is stored there too.
+BOT_PERSISTENCE = os.getenv(
+    "BOT_PERSISTENCE",
+    "postgres" if os.getenv("STORAGE_BACKEND", "postgres") == "postgres" else "none",
+)
+
+# How updates arrive: "polling" (default) or "webhook". Either way, run a
+# single bot process: conversation states, caches and per-user ordering are
+# kept in memory, so the web process must not be scaled past one instance.
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Webhook mode: public base URL Telegram calls, and the secret it must send back
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Heroku and most PaaS hosts pass the port to listen on in PORT
+WEBHOOK_PORT = int(os.getenv("PORT", "8443"))
+
+if BOT_PERSISTENCE not in ("postgres", "none"):
+    raise ValueError(f"Unknown BOT_PERSISTENCE: {BOT_PERSISTENCE}")
+if BOT_MODE not in ("polling", "webhook"):
+    raise ValueError(f"Unknown BOT_MODE: {BOT_MODE}")
+if BOT_MODE == "webhook" and not (WEBHOOK_URL and WEBHOOK_SECRET):
+    raise ValueError("BOT_MODE=webhook needs WEBHOOK_URL and WEBHOOK_SECRET.")
+
+# Telegram user IDs allowed to run admin commands like /dbstats and /slowplans
+ADMIN_USER_IDS = {
+    int(user_id)
+    for user_id in os.getenv("ADMIN_USER_IDS", "").split(",")
+    if user_id.strip()
+}
+
+
 # --- Constants ---
 DEFAULT_SORT_ORDER = "student_number"
+FIND_RESULT_LIMIT = 20  # Max matches shown by /find
+INLINE_PAGE_SIZE = 20  # Inline results per answer; more load via next_offset
+INLINE_RESULT_LIMIT = 100  # Max matches fetched (and cached) per inline query
+INLINE_CACHE_TIME = 10  # Seconds Telegram may cache an inline answer itself
+LIST_PAGE_SIZE = 50  # Students per /list page, keeps messages under Telegram's 4096 chars
+MAX_REPORTED_ERRORS = 20  # Rejected /add lines listed in the reply; the rest are counted
+MAX_QUOTED_LENGTH = 20  # Characters of a rejected value quoted back in an error
+
+# Edits of /list messages that were never sent because nothing changed
+EDITS_SKIPPED = REGISTRY.counter(
+    "bot_list_edits_skipped_total",
+    "List message edits skipped because the rendered content was unchanged.",
+)
+
+# Telegram's limit on callback data, in bytes
+CALLBACK_DATA_LIMIT = 64
+# Short sort codes used in page button callback data (limited to 64 bytes)
+SORT_CODES = {"student_number": "id", "student_name": "name"}
+SORT_ORDERS_BY_CODE = {code: order for order, code in SORT_CODES.items()}
+REVERSED_SORT_SUFFIX = "-r"
+
+# Sort button callback data -> sort order
+SORT_CALLBACKS = {
+    "list_sort_student_number": "student_number",
+    "list_sort_student_name": "student_name",
+}
 
 
 # --- Bot Handlers ---
@@ -47,7 +144,13 @@ DEFAULT_SORT_ORDER = "student_number"
     WAITING_FOR_EDIT_VALUE,
     WAITING_FOR_DELETE_IDENTIFIER,
     WAITING_FOR_DELETE_CONFIRMATION_NUMBER,
-) = range(6)
+    WAITING_FOR_IMPORT_FILE,
+) = range(7)
+
+# Telegram bots can't download files larger than 20 MB
+MAX_IMPORT_FILE_SIZE = 20 * 1024 * 1024
+# Exports stay in memory up to this size, then spill to a temporary file
+EXPORT_SPOOL_SIZE = 1024 * 1024
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -64,8 +167,12 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     await update.message.reply_text(
         "Available commands:\n"
         "/add - Add new student (Number then Name)\n"
+        "/add <lines> - Add many students at once, one 'number name' per line\n"
         "/list - Show all students\n"
         "/find <query> - Find student by number or name\n"
+        f"@{context.bot.username} <query> - Search from any chat (inline)\n"
+        "/import - Import students from a CSV or XLSX file\n"
+        "/export [gz] - Download all students as a CSV file (gz to compress)\n"
         # "/edit - Edit student information (TODO)\n" # Keep TODOs commented out for help
         "/delete - Delete student\n"
         "/cancel - Cancel current operation (like adding)\n"
@@ -73,15 +180,75 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     )
 
 
+def parse_student_lines(text: str) -> tuple[list, list]:
+    """Parses 'number name' lines into (number, name) rows.
+    Returns (rows, errors) where errors are human-readable per-line messages."""
+    rows = []
+    errors = []
+    for line_no, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        number, _, name = line.partition(" ")
+        name = name.strip()
+        shown = number
+        if len(shown) > MAX_QUOTED_LENGTH:
+            shown = shown[:MAX_QUOTED_LENGTH] + "..."
+        if not number.isdigit():
+            errors.append(f"Line {line_no}: '{shown}' is not a valid number")
+        elif not is_valid_number(number):
+            errors.append(
+                f"Line {line_no}: {shown} is longer than {MAX_NUMBER_LENGTH} digits"
+            )
+        elif not name:
+            errors.append(f"Line {line_no}: missing name for {shown}")
+        else:
+            rows.append((number, name))
+    return rows, errors
+
+
 async def add_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    # "/add" followed by 'number name' lines adds them all in one round trip
+    parts = update.message.text.split(maxsplit=1)
+    if len(parts) > 1:
+        return await add_bulk(update, context, parts[1])
+
     await update.message.reply_text("Please enter student number:")
     return WAITING_FOR_NUMBER
 
 
+async def add_bulk(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, text: str
+) -> int:
+    """Adds every valid 'number name' line of text and reports the rejected ones."""
+    rows, errors = parse_student_lines(text)
+
+    db = context.bot_data["db"]
+    written = 0
+    if rows:
+        # Lines repeating a number collapse into one student (the last one wins)
+        written = await db.add_students_bulk(update.effective_user.id, rows)
+
+    message = f"Added or updated {written} student(s)."
+    if written < len(rows):
+        message += f" {len(rows) - written} line(s) repeated a number and were overridden."
+    if errors:
+        # Stay under Telegram's 4096 character limit however many lines failed
+        message += f"\n\nSkipped {len(errors)} line(s):\n" + "\n".join(
+            errors[:MAX_REPORTED_ERRORS]
+        )
+        if len(errors) > MAX_REPORTED_ERRORS:
+            message += f"\n...and {len(errors) - MAX_REPORTED_ERRORS} more"
+    await update.message.reply_text(message)
+    return ConversationHandler.END
+
+
 async def handle_number(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     number = update.message.text
-    if not number.isdigit():
-        await update.message.reply_text("Please enter a valid number!")
+    if not is_valid_number(number):
+        await update.message.reply_text(
+            f"Please enter a valid number (up to {MAX_NUMBER_LENGTH} digits)!"
+        )
         return WAITING_FOR_NUMBER
 
     context.user_data["temp_number"] = number
@@ -95,7 +262,7 @@ async def handle_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
 
     # Access the database instance from bot_data
     db = context.bot_data["db"]
-    db.add_student(update.effective_user.id, number, name)
+    await db.add_student(update.effective_user.id, number, name)
 
     await update.message.reply_text(
         f"Student added successfully!\nNumber: {number}\nName: {name}"
@@ -103,6 +270,81 @@ async def handle_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     return ConversationHandler.END
 
 
+async def import_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Starts the import conversation."""
+    await update.message.reply_text(
+        "Please send a CSV or XLSX file with two columns: number and name.\n"
+        "A header row is optional. Use /cancel to stop."
+    )
+    return WAITING_FOR_IMPORT_FILE
+
+
+async def handle_import_file(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> int:
+    """Streams the uploaded roster file into the database and reports the counts."""
+    document = update.message.document
+    if document.file_size and document.file_size > MAX_IMPORT_FILE_SIZE:
+        await update.message.reply_text(
+            "That file is too large (max 20 MB). Please split it and try again."
+        )
+        return WAITING_FOR_IMPORT_FILE
+
+    file_name = (document.file_name or "").lower()
+    is_xlsx = file_name.endswith(".xlsx")
+    if not is_xlsx and not file_name.endswith((".csv", ".txt")):
+        await update.message.reply_text(
+            "Please send a .csv or .xlsx file, or /cancel."
+        )
+        return WAITING_FOR_IMPORT_FILE
+
+    db = context.bot_data["db"]
+    tg_file = await context.bot.get_file(document.file_id)
+    stats = {}
+    # Download to a temporary file on disk and parse it lazily from there,
+    # so large rosters never sit in memory as a whole
+    with tempfile.TemporaryFile() as tmp:
+        await tg_file.download_to_memory(out=tmp)
+        tmp.seek(0)
+        raw_rows = iter_xlsx_rows(tmp) if is_xlsx else iter_csv_rows(tmp)
+        try:
+            result = await db.import_students(
+                update.effective_user.id, clean_rows(raw_rows, stats)
+            )
+        except Exception as e:
+            print(f"Error importing roster: {e}")
+            await update.message.reply_text(
+                "Could not import that file. Please check its format and try again."
+            )
+            return ConversationHandler.END
+
+    # Repeated numbers in the file are merged into one row; count the extras as rejected
+    duplicates = stats["accepted"] - result["inserted"] - result["updated"]
+    await update.message.reply_text(
+        "Import finished:\n"
+        f"Inserted: {result['inserted']}\n"
+        f"Updated: {result['updated']}\n"
+        f"Rejected: {stats['rejected'] + duplicates}"
+    )
+    return ConversationHandler.END
+
+
+async def export_students(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Sends the user's whole roster as a CSV document, optionally gzipped."""
+    db = context.bot_data["db"]
+    compress = bool(context.args) and context.args[0].lower() in ("gz", "gzip")
+    filename = "students.csv.gz" if compress else "students.csv"
+
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE) as spool:
+        if compress:
+            with gzip.GzipFile(filename="students.csv", mode="wb", fileobj=spool) as out:
+                await db.export_students(update.effective_user.id, out)
+        else:
+            await db.export_students(update.effective_user.id, spool)
+        spool.seek(0)
+        await update.message.reply_document(document=spool, filename=filename)
+
+
 async def list_students(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Lists students with sorting options."""
     db = context.bot_data["db"]
@@ -111,15 +353,99 @@ async def list_students(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     # Get current sort order from user_data, default if not set
     sort_order = context.user_data.get("list_sort_order", DEFAULT_SORT_ORDER)
 
-    students = db.get_students(user_id, order_by=sort_order)
-
-    message_text, reply_markup = format_student_list(students, sort_order)
+    # Fetch the first page plus one row to see whether there is more
+    version = db.roster_version(user_id)
+    students = await db.get_students(
+        user_id, order_by=sort_order, limit=LIST_PAGE_SIZE + 1
+    )
+    if len(students) <= LIST_PAGE_SIZE:
+        rows = students  # The whole roster fits on one page
+    else:
+        rows = await load_snapshot_rows(context, db, user_id, sort_order, version)
+    if db.roster_version(user_id) != version:
+        version = None  # A write raced the read, so don't cache what we render
+
+    # Rosters small enough for a snapshot are kept with the message, so its
+    # sort, reverse and page buttons don't query the database again
+    snapshot = None
+    if rows is not None:
+        snapshot = RosterSnapshot(rows, sort_order, version)
+        origin = ("snapshot", sort_order)
+        students, has_prev, has_next = snapshot.page(LIST_PAGE_SIZE)
+    else:
+        origin = ("db", None, None)
+        has_prev = False
+        has_next = True
+        students = students[:LIST_PAGE_SIZE]
+
+    message_text, reply_markup = render_student_list(
+        context,
+        user_id,
+        version,
+        origin,
+        students,
+        sort_order,
+        has_prev=has_prev,
+        has_next=has_next,
+        reversible=snapshot is not None,
+    )
 
-    await update.message.reply_text(
+    sent = await update.message.reply_text(
         message_text,
         reply_markup=reply_markup,
         parse_mode=ParseMode.MARKDOWN_V2,  # Use MarkdownV2 for formatting
     )
+    message_key = (sent.chat_id, sent.message_id)
+    context.bot_data["message_hashes"].put(
+        message_key, render_hash(message_text, reply_markup)
+    )
+    if snapshot is not None:
+        context.bot_data["snapshots"].put(message_key, snapshot)
+
+
+async def load_snapshot_rows(
+    context: ContextTypes.DEFAULT_TYPE, db, user_id: int, sort_order: str, version
+) -> list | None:
+    """Reads the whole roster for a snapshot, or returns None if it has more
+    than SNAPSHOT_MAX_ROWS students. The read skips the roster cache, and an
+    oversized roster isn't read again until a write changes its version."""
+    snapshots = context.bot_data["snapshots"]
+    if snapshots.is_oversized(user_id, version):
+        return None
+    rows = await db.get_students_uncached(
+        user_id, order_by=sort_order, limit=SNAPSHOT_MAX_ROWS + 1
+    )
+    if len(rows) > SNAPSHOT_MAX_ROWS:
+        snapshots.mark_oversized(user_id, version)
+        return None
+    return rows
+
+
+async def fetch_student_page(
+    db, user_id: int, sort_order: str, after: str = None, before: str = None
+) -> tuple[list, bool, bool]:
+    """Fetches one page of students after/before a student_number cursor.
+    Returns (students, has_prev, has_next)."""
+    # Fetch one extra row to find out whether another page exists
+    if before is not None:
+        students = await db.get_students(
+            user_id, order_by=sort_order, limit=LIST_PAGE_SIZE + 1, before=before
+        )
+        has_prev = len(students) > LIST_PAGE_SIZE
+        students = students[-LIST_PAGE_SIZE:]
+        has_next = True
+    else:
+        students = await db.get_students(
+            user_id, order_by=sort_order, limit=LIST_PAGE_SIZE + 1, after=after
+        )
+        has_next = len(students) > LIST_PAGE_SIZE
+        students = students[:LIST_PAGE_SIZE]
+        has_prev = after is not None
+
+    if not students and (after is not None or before is not None):
+        # The cursor student was deleted or the page emptied; start over
+        return await fetch_student_page(db, user_id, sort_order)
+    return students, has_prev, has_next
 
 
 async def find_student(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -133,7 +459,12 @@ async def find_student(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
     # Access the database instance from bot_data
     db = context.bot_data["db"]
-    results = db.find_students(update.effective_user.id, query)
+    # Multi-word queries must match every word; single words also match typos.
+    # Either way the best matches come first.
+    mode = "fulltext" if len(query.split()) > 1 else "similarity"
+    results = await db.find_students(
+        update.effective_user.id, query, mode=mode, limit=FIND_RESULT_LIMIT
+    )
 
     if results:
         message = "Found matches:\n\n"
@@ -144,42 +475,189 @@ async def find_student(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         await update.message.reply_text("No matching students found.")
 
 
+async def inline_find(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Answers inline queries ("@bot anna" in any chat) by searching the
+    caller's roster like /find.
+
+    Matches are fetched once per (user, query, roster version) and cached
+    briefly, since a query fires on every keystroke; scrolling down asks for
+    the next page with the offset we returned in next_offset.
+    """
+    inline_query = update.inline_query
+    query = inline_query.query.strip()
+    user_id = inline_query.from_user.id
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+
+    matches = []
+    if query:
+        db = context.bot_data["db"]
+        cache = context.bot_data["inline_results"]
+        version = db.roster_version(user_id)
+        key = (user_id, version, query)
+        matches = cache.get(key)
+        if matches is None:
+            mode = "fulltext" if len(query.split()) > 1 else "similarity"
+            students = await db.find_students(
+                user_id, query, mode=mode, limit=INLINE_RESULT_LIMIT
+            )
+            matches = [
+                (student["student_number"], student["student_name"])
+                for student in students
+            ]
+            if db.roster_version(user_id) == version:
+                cache.put(key, matches)
+
+    page = matches[offset : offset + INLINE_PAGE_SIZE]
+    results = [
+        InlineQueryResultArticle(
+            id=str(position),  # Unique within the answer, and always under 64 bytes
+            title=name,
+            description=f"Number: {number}",
+            input_message_content=InputTextMessageContent(f"{name} ({number})"),
+        )
+        for position, (number, name) in enumerate(page, offset)
+    ]
+    next_offset = offset + INLINE_PAGE_SIZE
+    try:
+        await inline_query.answer(
+            results,
+            cache_time=INLINE_CACHE_TIME,
+            is_personal=True,  # Results come from the caller's own roster
+            next_offset=str(next_offset) if next_offset < len(matches) else "",
+        )
+    except BadRequest as e:
+        # The user typed on and Telegram no longer wants this answer
+        print(f"Could not answer inline query: {e}")
+
+
 async def list_button_callback(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
-    """Handles button presses for the student list (sorting)."""
+    """Handles button presses for the student list (sorting, reversing and paging)."""
     query = update.callback_query
     await query.answer()  # Answer the callback query first
 
     callback_data = query.data
     user_id = query.from_user.id
     db = context.bot_data["db"]
-
-    # Get the *current* sort order before changing it
-    current_sort_order = context.user_data.get("list_sort_order", DEFAULT_SORT_ORDER)
-    new_sort_order = current_sort_order
-
-    # Determine potential new sort order based on button pressed
-    if callback_data == "list_sort_student_number":
-        new_sort_order = "student_number"
-    elif callback_data == "list_sort_student_name":
-        new_sort_order = "student_name"
-
-    # --- Check if sort order actually changed ---
-    if new_sort_order == current_sort_order:
-        # If not changed, do nothing (or maybe send a subtle notification)
-        # await query.answer("List is already sorted this way.") # Optional feedback
+    reverse = False
+
+    snapshots = context.bot_data["snapshots"]
+    snapshot_key = (query.message.chat_id, query.message.message_id)
+    snapshot = snapshots.get(snapshot_key)
+    if snapshot is not None and snapshot.version != db.roster_version(user_id):
+        # The roster changed since /list, so serve pages from the database
+        snapshots.discard(snapshot_key)
+        snapshot = None
+    if snapshot is not None:
+        # --- Served from the message's snapshot, no database query ---
+        if callback_data == "list_reverse":
+            snapshot.reverse = not snapshot.reverse
+            snapshot.offset = 0
+        elif callback_data.startswith("list_page:"):
+            # The button's start index, not the shared offset, so tapping an
+            # old button again shows the same page instead of moving further
+            start = callback_data.split(":", 4)[3]
+            snapshot.offset = max(int(start) - 1, 0)
+        else:
+            new_sort_order = SORT_CALLBACKS.get(callback_data, snapshot.sort_order)
+            if new_sort_order == snapshot.sort_order:
+                return  # Already sorted this way
+            context.user_data["list_sort_order"] = new_sort_order
+            snapshot.sort_order = new_sort_order
+            snapshot.reverse = False
+            snapshot.offset = 0
+
+        new_sort_order = snapshot.sort_order
+        reverse = snapshot.reverse
+        version = snapshot.version
+        origin = ("snapshot", snapshot.loaded_order)
+        students, has_prev, has_next = snapshot.page(LIST_PAGE_SIZE)
+        page_start = snapshot.offset + 1  # page() may have clamped the offset
+    elif callback_data == "list_reverse":
+        # Reversing needs the snapshot, which has expired; /list makes a new one
         return
+    elif callback_data.startswith("list_page:"):
+        # Page buttons carry their own sort order, start index and cursor:
+        # list_page:<sort code>:<next|prev>:<start index>:<student_number>
+        _, sort_code, direction, start, cursor = callback_data.split(":", 4)
+        new_sort_order = SORT_ORDERS_BY_CODE.get(
+            sort_code.removesuffix(REVERSED_SORT_SUFFIX), DEFAULT_SORT_ORDER
+        )
+        page_start = max(int(start), 1)
+        version = db.roster_version(user_id)
+        origin = ("db", direction, cursor)
+        if sort_code.endswith(REVERSED_SORT_SUFFIX) or not cursor:
+            # Cursors of a reversed snapshot view don't apply to database
+            # pages, and an over-long cursor was left out; start over from
+            # the first page
+            origin = ("db", None, None)
+            students, has_prev, has_next = await fetch_student_page(
+                db, user_id, new_sort_order
+            )
+        elif direction == "prev":
+            students, has_prev, has_next = await fetch_student_page(
+                db, user_id, new_sort_order, before=cursor
+            )
+        else:
+            students, has_prev, has_next = await fetch_student_page(
+                db, user_id, new_sort_order, after=cursor
+            )
+        if not has_prev:
+            page_start = 1  # Fell back to (or reached) the first page
+    else:
+        # Get the *current* sort order before changing it
+        current_sort_order = context.user_data.get(
+            "list_sort_order", DEFAULT_SORT_ORDER
+        )
+        new_sort_order = current_sort_order
+
+        # Determine potential new sort order based on button pressed
+        new_sort_order = SORT_CALLBACKS.get(callback_data, current_sort_order)
+
+        # --- Check if sort order actually changed ---
+        if new_sort_order == current_sort_order:
+            # If not changed, do nothing (or maybe send a subtle notification)
+            # await query.answer("List is already sorted this way.") # Optional feedback
+            return
+
+        # --- If sort order changed, proceed ---
+        # Store the new sort order
+        context.user_data["list_sort_order"] = new_sort_order
+
+        # Fetch the first page in the new order
+        page_start = 1
+        version = db.roster_version(user_id)
+        origin = ("db", None, None)
+        students, has_prev, has_next = await fetch_student_page(
+            db, user_id, new_sort_order
+        )
 
-    # --- If sort order changed, proceed ---
-    # Store the new sort order
-    context.user_data["list_sort_order"] = new_sort_order
-
-    # Fetch sorted students
-    students = db.get_students(user_id, order_by=new_sort_order)
+    if snapshot is None and db.roster_version(user_id) != version:
+        version = None  # A write raced the read, so don't cache what we render
 
     # Format the message and keyboard again
-    message_text, reply_markup = format_student_list(students, new_sort_order)
+    message_text, reply_markup = render_student_list(
+        context,
+        user_id,
+        version,
+        origin,
+        students,
+        new_sort_order,
+        page_start=page_start,
+        has_prev=has_prev,
+        has_next=has_next,
+        reverse=reverse,
+        reversible=snapshot is not None,
+    )
+
+    # Skip the API call if the message already shows exactly this
+    message_hashes = context.bot_data["message_hashes"]
+    message_key = (query.message.chat_id, query.message.message_id)
+    new_hash = render_hash(message_text, reply_markup)
+    if message_hashes.get(message_key) == new_hash:
+        EDITS_SKIPPED.inc(reason="unchanged")
+        return
 
     # Edit the original message
     try:
@@ -188,10 +666,12 @@ async def list_button_callback(
             reply_markup=reply_markup,
             parse_mode=ParseMode.MARKDOWN_V2,
         )
+        message_hashes.put(message_key, new_hash)
     except BadRequest as e:
-        # Handle potential error if the message content hasn't changed
+        # Still possible when the hash was forgotten (e.g. after a restart)
         if "Message is not modified" in str(e):
-            print("Message not modified (already sorted).")  # Log less critically
+            message_hashes.put(message_key, new_hash)
+            EDITS_SKIPPED.inc(reason="not_modified")
         else:
             print(f"Error editing message: {e}")  # Log other BadRequests
             # Optionally notify the user
@@ -219,19 +699,106 @@ async def hello(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text(f"Hello {update.effective_user.first_name}")
 
 
+async def db_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Shows connection pool and cache statistics (admins only)."""
+    if update.effective_user.id not in ADMIN_USER_IDS:
+        return
+
+    db = context.bot_data["db"]
+    stats = db.pool_stats()
+    page_stats = context.bot_data["pages"].stats()
+    stats.update({f"page_cache_{key}": value for key, value in page_stats.items()})
+
+    message = "Database stats:\n"
+    # The cache counters are always there, so ask the wrapped storage
+    if not db.db.pool_stats():
+        message += "Database is not running in pooled mode.\n"
+    for key, value in stats.items():
+        message += f"{key}: {value}\n"
+    await update.message.reply_text(message)
+
+
+async def slow_plans(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Shows the most recent captured slow query plans (admins only).
+    Usage: /slowplans [count]"""
+    if update.effective_user.id not in ADMIN_USER_IDS:
+        return
+
+    count = 3
+    if context.args and context.args[0].isdigit():
+        count = max(1, int(context.args[0]))
+    plans = list(SLOW_PLANS)[-count:]
+    if not plans:
+        await update.message.reply_text("No slow query plans captured yet.")
+        return
+
+    for plan in reversed(plans):  # Newest first
+        captured = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(plan["at"]))
+        message = (
+            f"{captured} UTC, {plan['ms']:.1f} ms\n"
+            f"{plan['query']}\nparams={plan['params']}\n\n{plan['plan']}"
+        )
+        # Stay under Telegram's 4096 character limit
+        await update.message.reply_text(message[:4000])
+
+
+# Translation table that prefixes every MarkdownV2 special character with a backslash
+MARKDOWN_ESCAPES = str.maketrans({char: f"\\{char}" for char in r"_*[]()~`>#+-=|{}.!"})
+
+
 # Helper function to escape MarkdownV2 characters
 def escape_markdown(text: str) -> str:
     """Helper function to escape telegram MarkdownV2 characters."""
-    text = str(text)
-    escape_chars = r"_*[]()~`>#+-=|{}.!"
-    return "".join(f"\\{char}" if char in escape_chars else char for char in text)
+    return str(text).translate(MARKDOWN_ESCAPES)
+
+
+def render_student_list(
+    context: ContextTypes.DEFAULT_TYPE,
+    user_id: int,
+    version: int | None,
+    origin: tuple,
+    students: list,
+    sort_order: str,
+    **kwargs,
+) -> tuple[str, InlineKeyboardMarkup]:
+    """format_student_list through the rendered page cache.
+
+    version is the roster version the students were read at; None skips the
+    cache. origin tells apart pages at the same position that were read
+    differently: ("snapshot", order the snapshot was loaded in) or
+    ("db", direction, cursor). A write bumps the version, so stale pages
+    are never hit again and just age out of the LRU.
+    """
+    if version is None:
+        return format_student_list(students, sort_order, **kwargs)
+    pages = context.bot_data["pages"]
+    key = (user_id, version, origin, sort_order, tuple(sorted(kwargs.items())))
+    rendered = pages.get(key)
+    if rendered is None:
+        rendered = format_student_list(students, sort_order, **kwargs)
+        pages.put(key, rendered)
+    return rendered
+
+
+def render_hash(message_text: str, reply_markup: InlineKeyboardMarkup | None) -> int:
+    """Hash of a rendered message, to tell whether an edit would change anything."""
+    markup_json = reply_markup.to_json() if reply_markup is not None else None
+    return hash((message_text, markup_json))
 
 
 # Helper function to format the student list and create keyboard
 def format_student_list(
-    students: list, sort_order: str
+    students: list,
+    sort_order: str,
+    page_start: int = 1,
+    has_prev: bool = False,
+    has_next: bool = False,
+    reverse: bool = False,
+    reversible: bool = False,
 ) -> tuple[str, InlineKeyboardMarkup]:
-    """Formats the student list as a Markdown table and creates sorting buttons."""
+    """Formats one page of the student list as a Markdown table and creates
+    sorting and paging buttons. page_start is the row number of the first student.
+    reversible adds a reverse-order button (only snapshot-backed lists can reverse)."""
     if not students:
         # Escape the message in case it contains special characters
         return escape_markdown("No students in the database."), None
@@ -242,7 +809,7 @@ def format_student_list(
 
     # --- Create Table Rows ---
     rows = []
-    for i, student in enumerate(students, 1):
+    for i, student in enumerate(students, page_start):
         # Escape each part *before* formatting
         num_str = escape_markdown(i)
         id_str = escape_markdown(student["student_number"])
@@ -254,6 +821,8 @@ def format_student_list(
     # --- Create Title ---
     # Escape the sort_order part before including it in the f-string
     escaped_sort_order = escape_markdown(sort_order.replace("_", " "))
+    if reverse:
+        escaped_sort_order += ", reversed"
     title = "*Students List* \\(Sorted by " + escaped_sort_order + "\\)\n\n"
 
     message_text = title + header + separator + "\n".join(rows)
@@ -270,13 +839,57 @@ def format_student_list(
                 callback_data="list_sort_student_name",
             ),
         ],
-        # Add pagination buttons here later if needed
     ]
+    if reversible:
+        keyboard[0].append(
+            InlineKeyboardButton(
+                f"Reverse {'✅' if reverse else ''}", callback_data="list_reverse"
+            )
+        )
+
+    # --- Paging buttons (keyset cursors: first/last student_number on the page) ---
+    sort_code = SORT_CODES[sort_order]
+    if reverse:
+        sort_code += REVERSED_SORT_SUFFIX
+    page_buttons = []
+    if has_prev:
+        prev_start = max(page_start - LIST_PAGE_SIZE, 1)
+        page_buttons.append(
+            InlineKeyboardButton(
+                "⬅️ Prev",
+                callback_data=page_callback_data(
+                    sort_code, "prev", prev_start, students[0]["student_number"]
+                ),
+            )
+        )
+    if has_next:
+        next_start = page_start + len(students)
+        page_buttons.append(
+            InlineKeyboardButton(
+                "Next ➡️",
+                callback_data=page_callback_data(
+                    sort_code, "next", next_start, students[-1]["student_number"]
+                ),
+            )
+        )
+    if page_buttons:
+        keyboard.append(page_buttons)
     reply_markup = InlineKeyboardMarkup(keyboard)
 
     return message_text, reply_markup
 
 
+def page_callback_data(sort_code: str, direction: str, start: int, cursor: str) -> str:
+    """Callback data of a page button. A cursor that would push it past
+    CALLBACK_DATA_LIMIT (a long number stored before MAX_NUMBER_LENGTH) is
+    left out; the button then pages from its start index in a snapshot, or
+    starts over from the first page."""
+    callback_data = f"list_page:{sort_code}:{direction}:{start}:{cursor}"
+    if len(callback_data.encode()) > CALLBACK_DATA_LIMIT:
+        callback_data = f"list_page:{sort_code}:{direction}:{start}:"
+    return callback_data
+
+
 async def delete_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Starts the delete conversation."""
     await update.message.reply_text(
@@ -295,7 +908,7 @@ async def handle_delete_identifier(
     print(f"Attempting to delete identifier: {identifier} for user: {user_id}")
 
     # Find potential matches
-    results = db.find_students(user_id, identifier)
+    results = await db.find_students(user_id, identifier)
 
     if not results:
         print(
@@ -317,7 +930,7 @@ async def handle_delete_identifier(
         student_number = student_to_delete["student_number"]
         student_name = student_to_delete["student_name"]
 
-        if db.delete_student(user_id, student_number):
+        if await db.delete_student(user_id, student_number):
             await update.message.reply_text(
                 f"Student deleted successfully:\n"
                 f"Number: {escape_markdown(student_number)}\n"
@@ -375,7 +988,7 @@ async def handle_delete_confirmation_number(
         number_to_delete, "Unknown"
     )  # Get name for confirmation message
 
-    if db.delete_student(user_id, number_to_delete):
+    if await db.delete_student(user_id, number_to_delete):
         await update.message.reply_text(
             f"Student deleted successfully:\n"
             f"Number: {escape_markdown(number_to_delete)}\n"
@@ -394,17 +1007,63 @@ async def handle_delete_confirmation_number(
     return ConversationHandler.END
 
 
+# --- Application lifecycle hooks ---
+async def on_startup(app: Application) -> None:
+    """Connects the database inside the bot's event loop."""
+    await app.bot_data["db"].connect()
+
+
+async def on_shutdown(app: Application) -> None:
+    """Closes the database connection when the bot stops."""
+    await app.bot_data["db"].close()
+
+
 # --- Main Function ---
 def main():
-    # Initialize the database instance
+    # Initialize the storage backend selected by STORAGE_BACKEND (and DB_MODE for Postgres)
     # Ensure load_dotenv() is called *before* this line
-    db = Database()
+    db = create_storage()
+    # Time every storage call (cache hits below don't reach the database, so aren't timed)
+    db = InstrumentedStorage(db)
+    # Serve repeated /list views and sort toggles from memory until a write
+    db = CachedDatabase(db)
+
+    if METRICS_PORT:
+        register_stats_collector(db)
+        start_metrics_server(int(METRICS_PORT))
 
     # Build the Application
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    builder = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        # Queue replies and edits per chat to stay under Telegram's flood limits
+        .rate_limiter(OutgoingRateLimiter())
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    persistent = BOT_PERSISTENCE == "postgres"
+    if persistent:
+        # Imported here so the sqlite and memory backends don't need psycopg
+        from persistence import PostgresPersistence
+
+        builder = builder.persistence(PostgresPersistence())
+    app = builder.build()
 
     # Store the database instance in bot_data to access it in handlers
     app.bot_data["db"] = db
+    # Per-message roster snapshots that serve /list button presses from memory
+    app.bot_data["snapshots"] = SnapshotStore()
+    # Rendered /list pages keyed by roster version, see render_student_list
+    app.bot_data["pages"] = RosterCache(max_size=PAGE_CACHE_SIZE)
+    # Last rendered content hash per /list message, see list_button_callback
+    app.bot_data["message_hashes"] = RosterCache(
+        max_size=MESSAGE_HASH_CACHE_SIZE, ttl=MESSAGE_HASH_TTL
+    )
+    # Inline search results keyed by roster version, see inline_find
+    app.bot_data["inline_results"] = RosterCache(
+        max_size=INLINE_CACHE_SIZE, ttl=INLINE_CACHE_TTL
+    )
 
     # Add conversation handler for adding students
     add_conv_handler = ConversationHandler(
@@ -418,6 +1077,20 @@ def main():
             ],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="add",
+        persistent=persistent,
+    )
+
+    import_conv_handler = ConversationHandler(
+        entry_points=[CommandHandler("import", import_start)],
+        states={
+            WAITING_FOR_IMPORT_FILE: [
+                MessageHandler(filters.Document.ALL, handle_import_file)
+            ],
+        },
+        fallbacks=[CommandHandler("cancel", cancel)],
+        name="import",
+        persistent=persistent,
     )
 
     delete_conv_handler = ConversationHandler(
@@ -435,6 +1108,8 @@ def main():
             ],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="delete",
+        persistent=persistent,
         # Optional: Add conversation timeout
         # conversation_timeout=300 # e.g., 5 minutes
     )
@@ -444,18 +1119,33 @@ def main():
     app.add_handler(CommandHandler("help", help_command))
     app.add_handler(add_conv_handler)
     app.add_handler(delete_conv_handler)
+    app.add_handler(import_conv_handler)
     app.add_handler(CommandHandler("list", list_students))
     app.add_handler(CommandHandler("find", find_student))
+    app.add_handler(CommandHandler("export", export_students))
     app.add_handler(CommandHandler("hello", hello))
-
-    app.add_handler(CallbackQueryHandler(list_button_callback, pattern="^list_sort_"))
-
-    # Start the bot (using polling)
-    print("Bot is running...")
-    app.run_polling()
-
-    # Close the database connection when the bot stops
-    db.close()
+    app.add_handler(CommandHandler("dbstats", db_stats))
+    app.add_handler(CommandHandler("slowplans", slow_plans))
+
+    app.add_handler(CallbackQueryHandler(list_button_callback, pattern="^list_"))
+    # Needs inline mode switched on for the bot in @BotFather (/setinline)
+    app.add_handler(InlineQueryHandler(inline_find))
+
+    # The database connection is closed by on_shutdown
+    if BOT_MODE == "webhook":
+        asyncio.run(
+            run_webhook(
+                app,
+                WEBHOOK_URL,
+                WEBHOOK_SECRET,
+                port=WEBHOOK_PORT,
+                path=WEBHOOK_PATH,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+            )
+        )
+    else:
+        print("Bot is running...")
+        app.run_polling()
 
 
 if __name__ == "__main__":
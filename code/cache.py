@@ -0,0 +1,182 @@
+import os
+import time
+from collections import OrderedDict
+
+
+# Roster cache sizing: max cached get_students results and their lifetime in seconds
+ROSTER_CACHE_SIZE = int(os.getenv("ROSTER_CACHE_SIZE", "1024"))
+ROSTER_CACHE_TTL = float(os.getenv("ROSTER_CACHE_TTL", "300"))
+# Max cached rendered /list pages (message text and keyboard)
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "512"))
+# Inline search results per (user, query); short-lived, queries fire on every keystroke
+INLINE_CACHE_SIZE = int(os.getenv("INLINE_CACHE_SIZE", "1024"))
+INLINE_CACHE_TTL = float(os.getenv("INLINE_CACHE_TTL", "60"))
+# /list messages whose last rendered content hash is remembered, and for how long
+MESSAGE_HASH_CACHE_SIZE = int(os.getenv("MESSAGE_HASH_CACHE_SIZE", "4096"))
+MESSAGE_HASH_TTL = float(os.getenv("MESSAGE_HASH_TTL", "3600"))
+
+
+class RosterCache:
+    """Bounded LRU cache with a TTL, keyed by tuples that start with user_id.
+
+    Entries of one user can be dropped together with invalidate_user(), which
+    is what every write does. Not thread-safe; it's only used from the event loop.
+    """
+
+    def __init__(self, max_size: int = ROSTER_CACHE_SIZE, ttl: float = ROSTER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value), LRU first
+        self._keys_by_user = {}  # user_id -> set of keys, for invalidation
+        self._generations = {}  # user_id -> write counter, see generation()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Returns the cached value for key, or None on a miss."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._keys_by_user.setdefault(key[0], set()).add(key)
+        while len(self._entries) > self.max_size:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def generation(self, user_id: int) -> int:
+        """Returns the user's write counter. A read that started before a write
+        must not store its (possibly stale) result, so callers compare this
+        before and after the query."""
+        return self._generations.get(user_id, 0)
+
+    def invalidate_user(self, user_id: int):
+        """Drops every cached entry of a user after a write."""
+        self._generations[user_id] = self.generation(user_id) + 1
+        for key in self._keys_by_user.pop(user_id, ()):
+            self._entries.pop(key, None)
+        self.invalidations += 1
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        user_keys = self._keys_by_user.get(key[0])
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._keys_by_user[key[0]]
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+class CachedDatabase:
+    """Read-through roster cache in front of an async database (AsyncDatabase
+    or ExecutorDatabase).
+
+    get_students results are cached per (user_id, order_by, page arguments);
+    every write method invalidates that user's entries. Other methods are
+    passed through unchanged. The cache is per process, so it assumes the
+    bot is the only writer.
+    """
+
+    def __init__(self, db, cache: RosterCache = None):
+        self.db = db
+        self.cache = cache if cache is not None else RosterCache()
+
+    def __getattr__(self, name):
+        # Everything that isn't cached or a write goes straight to the database
+        return getattr(self.db, name)
+
+    def roster_version(self, user_id: int) -> int:
+        """Returns the user's roster version, which every write through this
+        wrapper bumps. Anything derived from the roster can be keyed by it."""
+        return self.cache.generation(user_id)
+
+    async def get_students_uncached(
+        self, user_id: int, order_by: str = "student_number", limit: int | None = None
+    ):
+        """Reads past the cache, for one-off large reads (roster snapshots)
+        that would otherwise crowd the small page entries out of the cache."""
+        return await self.db.get_students(user_id, order_by, limit)
+
+    def pool_stats(self) -> dict:
+        """Returns the database stats merged with cache counters."""
+        stats = self.db.pool_stats()
+        stats.update({f"cache_{key}": value for key, value in self.cache.stats().items()})
+        return stats
+
+    async def get_students(
+        self,
+        user_id: int,
+        order_by: str = "student_number",
+        limit: int | None = None,
+        after: str | None = None,
+        before: str | None = None,
+    ):
+        key = (user_id, order_by, limit, after, before)
+        students = self.cache.get(key)
+        if students is not None:
+            return students
+
+        generation = self.cache.generation(user_id)
+        students = await self.db.get_students(user_id, order_by, limit, after, before)
+        if self.cache.generation(user_id) == generation:
+            self.cache.put(key, students)
+        return students
+
+    async def add_student(self, user_id: int, number: str, name: str):
+        try:
+            return await self.db.add_student(user_id, number, name)
+        finally:
+            self.cache.invalidate_user(user_id)
+
+    async def add_students_bulk(self, user_id: int, rows) -> int:
+        try:
+            return await self.db.add_students_bulk(user_id, rows)
+        finally:
+            self.cache.invalidate_user(user_id)
+
+    async def import_students(self, user_id: int, rows) -> dict:
+        try:
+            return await self.db.import_students(user_id, rows)
+        finally:
+            self.cache.invalidate_user(user_id)
+
+    async def delete_student(self, user_id: int, student_number: str) -> bool:
+        try:
+            return await self.db.delete_student(user_id, student_number)
+        finally:
+            self.cache.invalidate_user(user_id)
+
+    async def update_student_name(
+        self, user_id: int, student_number: str, new_name: str
+    ) -> bool:
+        try:
+            return await self.db.update_student_name(user_id, student_number, new_name)
+        finally:
+            self.cache.invalidate_user(user_id)
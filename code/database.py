@@ -1,7 +1,16 @@
 import os
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
 from psycopg2.extras import DictCursor
 
+from importer import CsvRowStream
+from migrate import migrate
+from storage import like_pattern
+from instrumentation import explain_query, observe_query, record_plan, should_explain
+
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
@@ -11,92 +20,527 @@ if not DATABASE_URL:
     # For simplicity here, we'll let psycopg2 connection fail or add a check.
     print("Warning: DATABASE_URL environment variable not set.")
 
+# Connection pool sizing (used when a database class is created with pooled=True)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Seconds an idle connection above DB_POOL_MIN is kept before being closed
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+
+
+# --- SQL shared by the sync and async database classes ---
+# Both psycopg2 and psycopg 3 use the %s placeholder style, so the same
+# statements work for Database and AsyncDatabase.
+
+ALLOWED_ORDERS = {"student_number", "student_name"}
+
+# Column actually sorted on for each order. student_number is TEXT, so ID
+# order uses the numeric student_number_key maintained by a trigger
+# (migration 0003); student_number then breaks ties, e.g. "7" vs "007".
+SORT_COLUMNS = {
+    "student_number": "student_number_key",
+    "student_name": "student_name",
+}
+
+UPSERT_STUDENT = """
+    INSERT INTO students (user_id, student_number, student_name)
+    VALUES (%s, %s, %s)
+    ON CONFLICT (user_id, student_number)
+    DO UPDATE SET student_name = EXCLUDED.student_name;
+"""
+
+# Bulk upsert in a single statement: the rows travel as two parallel arrays.
+# unnest works the same with psycopg2 and psycopg 3, unlike execute_values.
+UPSERT_STUDENTS_BULK = """
+    INSERT INTO students (user_id, student_number, student_name)
+    SELECT %s, number, name FROM unnest(%s::text[], %s::text[]) AS rows(number, name)
+    ON CONFLICT (user_id, student_number)
+    DO UPDATE SET student_name = EXCLUDED.student_name;
+"""
+
+# Roster import: rows are streamed with COPY into a per-transaction staging
+# table, then merged into students with a single upsert.
+CREATE_IMPORT_STAGING = """
+    CREATE TEMP TABLE students_import (
+        line_no BIGSERIAL,
+        student_number TEXT,
+        student_name TEXT
+    ) ON COMMIT DROP
+"""
+
+COPY_IMPORT_STAGING = (
+    "COPY students_import (student_number, student_name) FROM STDIN"
+)
+
+# Later lines win when a number repeats. Counts inserted vs updated rows
+# (xmax = 0 only for freshly inserted rows) without returning every row.
+MERGE_IMPORT_STAGING = """
+    WITH merged AS (
+        INSERT INTO students (user_id, student_number, student_name)
+        SELECT DISTINCT ON (student_number) %s, student_number, student_name
+        FROM students_import
+        ORDER BY student_number, line_no DESC
+        ON CONFLICT (user_id, student_number)
+        DO UPDATE SET student_name = EXCLUDED.student_name
+        RETURNING (xmax = 0) AS inserted
+    )
+    SELECT
+        COUNT(*) FILTER (WHERE inserted) AS inserted,
+        COUNT(*) FILTER (WHERE NOT inserted) AS updated
+    FROM merged
+"""
+
+# Roster export: COPY streams CSV straight from the server, no per-row Python objects.
+# The header matches what the importer skips, so exports can be re-imported.
+EXPORT_STUDENTS = """
+    COPY (
+        SELECT student_number, student_name FROM students
+        WHERE user_id = %s
+        ORDER BY student_number_key, student_number
+    ) TO STDOUT WITH (FORMAT csv, HEADER)
+"""
+
+SELECT_STUDENTS = """
+    SELECT student_number, student_name
+    FROM students
+    WHERE user_id = %s
+    {seek}
+    ORDER BY {sort_column} {direction}, student_number {direction}
+    LIMIT %s
+"""
+
+# Keyset condition: rows strictly after/before the cursor student in sort order.
+# The cursor is a student_number and its sort value is looked up by primary key,
+# so callers (e.g. button callback data) only have to carry the number.
+SEEK_CONDITION = """
+    AND ({sort_column}, student_number) {op} (
+        SELECT {sort_column}, student_number FROM students
+        WHERE user_id = %s AND student_number = %s
+    )
+"""
+
+FIND_STUDENTS = """
+    SELECT student_number, student_name FROM students
+    WHERE user_id = %s
+    AND (student_number = %s OR LOWER(student_name) LIKE %s)
+    ORDER BY {sort_column}, student_number
+    LIMIT %s;
+"""
+
+# Ranked search: exact number match first, then by trigram word similarity.
+# "<%" also matches names with small typos, and is served by the trigram index.
+FIND_STUDENTS_RANKED = """
+    SELECT student_number, student_name FROM students
+    WHERE user_id = %s
+    AND (
+        student_number = %s
+        OR LOWER(student_name) LIKE %s
+        OR %s <%% LOWER(student_name)
+    )
+    ORDER BY student_number = %s DESC,
+        word_similarity(%s, LOWER(student_name)) DESC,
+        student_name
+    LIMIT %s;
+"""
+
+# Full-text search: every word of the query must match a name token.
+# The exact student_number match is kept as a primary key lookup.
+FIND_STUDENTS_FULLTEXT = """
+    SELECT student_number, student_name FROM students
+    WHERE user_id = %s
+    AND (
+        student_number = %s
+        OR student_name_tsv @@ websearch_to_tsquery('simple', %s)
+    )
+    ORDER BY student_number = %s DESC,
+        ts_rank(student_name_tsv, websearch_to_tsquery('simple', %s)) DESC,
+        student_name
+    LIMIT %s;
+"""
+
+# Search modes accepted by find_students
+FIND_MODES = {"substring", "similarity", "fulltext"}
+
+DELETE_STUDENT = """
+    DELETE FROM students
+    WHERE user_id = %s AND student_number = %s;
+"""
+
+UPDATE_STUDENT_NAME = """
+    UPDATE students
+    SET student_name = %s
+    WHERE user_id = %s AND student_number = %s;
+"""
+
+
+def safe_order_by(order_by: str) -> str:
+    """Validates order_by against a fixed set of columns to prevent SQL injection."""
+    if order_by not in ALLOWED_ORDERS:
+        return "student_number"  # Default to a safe value
+    return order_by
+
+
+def bulk_upsert_params(user_id: int, rows) -> tuple:
+    """Returns the UPSERT_STUDENTS_BULK parameters for (number, name) rows.
+    Later duplicates of a number win, since one statement can't update a row twice."""
+    students = dict(rows)
+    return (user_id, list(students.keys()), list(students.values()))
+
+
+def build_students_query(
+    user_id: int,
+    order_by: str = "student_number",
+    limit: int | None = None,
+    after: str | None = None,
+    before: str | None = None,
+) -> tuple[str, tuple, bool]:
+    """Returns the SQL and parameters for get_students, plus whether the rows
+    come back in reverse order (when seeking backwards with before)."""
+    # Formatting is safe here because order_by is validated against a fixed set
+    sort_column = SORT_COLUMNS[safe_order_by(order_by)]
+    direction = "DESC" if before is not None else "ASC"
+    params = [user_id]
+    seek = ""
+    cursor = after if after is not None else before
+    if cursor is not None:
+        op = ">" if after is not None else "<"
+        seek = SEEK_CONDITION.format(sort_column=sort_column, op=op)
+        params += [user_id, cursor]
+    params.append(limit)
+    sql_query = SELECT_STUDENTS.format(
+        seek=seek, sort_column=sort_column, direction=direction
+    )
+    return sql_query, tuple(params), before is not None
+
+
+def build_find_query(
+    user_id: int,
+    query: str,
+    order_by: str = "student_number",
+    mode: str = "substring",
+    limit: int | None = None,
+) -> tuple[str, tuple]:
+    """Returns the SQL and parameters for find_students.
+    In the "similarity" and "fulltext" modes order_by is ignored and the best
+    matches come first. A limit of None returns all matches."""
+    if mode == "similarity":
+        lowered = query.lower()
+        params = (user_id, query, like_pattern(query), lowered, query, lowered, limit)
+        return FIND_STUDENTS_RANKED, params
+    if mode == "fulltext":
+        params = (user_id, query, query, query, query, limit)
+        return FIND_STUDENTS_FULLTEXT, params
+    sql_query = FIND_STUDENTS.format(sort_column=SORT_COLUMNS[safe_order_by(order_by)])
+    return sql_query, (user_id, query, like_pattern(query), limit)
+
+
+class PoolError(Exception):
+    """Raised when a connection can't be checked out of a ConnectionPool."""
+
+
+class ConnectionPool:
+    """Thread-safe psycopg2 connection pool with blocking checkout.
+
+    Keeps at least min_size connections open and never more than max_size.
+    Idle connections above min_size are closed after max_idle seconds, and
+    connections that come back broken are discarded instead of reused.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int = DB_POOL_MIN,
+        max_size: int = DB_POOL_MAX,
+        max_idle: float = DB_POOL_MAX_IDLE,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size: need 0 <= min_size <= max_size, max_size >= 1.")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self._cond = threading.Condition()
+        self._idle = []  # (connection, returned_at) pairs, oldest first
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+        # Checkout statistics
+        self._checkouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        for _ in range(min_size):
+            self._idle.append((psycopg2.connect(dsn), time.monotonic()))
+
+    def _size(self) -> int:
+        return self._in_use + len(self._idle)
+
+    def _recycle_idle(self):
+        """Closes connections idle longer than max_idle, keeping min_size open.
+        Must be called with the lock held."""
+        now = time.monotonic()
+        while (
+            self._idle
+            and self._size() > self.min_size
+            and now - self._idle[0][1] > self.max_idle
+        ):
+            conn, _ = self._idle.pop(0)
+            conn.close()
+
+    def getconn(self, timeout: float | None = None):
+        """Checks out a connection, waiting up to timeout seconds if the pool is exhausted."""
+        start = time.monotonic()
+        conn = None
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._closed:
+                        raise PoolError("Connection pool is closed.")
+                    self._recycle_idle()
+                    if self._idle:
+                        conn, _ = self._idle.pop()  # Most recently used first
+                        if conn.closed:
+                            conn = None
+                            continue
+                        break
+                    if self._size() < self.max_size:
+                        break  # Room for a new connection, opened below
+                    remaining = None
+                    if timeout is not None:
+                        remaining = timeout - (time.monotonic() - start)
+                        if remaining <= 0:
+                            raise PoolError("Timed out waiting for a database connection.")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._in_use += 1
+            waited = time.monotonic() - start
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+        if conn is None:
+            # Open outside the lock so other threads aren't blocked on the handshake
+            try:
+                conn = psycopg2.connect(self.dsn)
+            except Exception:
+                with self._cond:
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+        return conn
+
+    def putconn(self, conn):
+        """Returns a connection to the pool. Broken connections are discarded."""
+        if not conn.closed:
+            try:
+                conn.rollback()  # Discard anything left uncommitted
+            except psycopg2.Error:
+                conn.close()
+        with self._cond:
+            self._in_use -= 1
+            if conn.closed or self._closed:
+                conn.close()
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._recycle_idle()
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Checks out a connection for the duration of a with-block."""
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def stats(self) -> dict:
+        """Returns a snapshot of pool usage, for sizing the pool under load."""
+        with self._cond:
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size(),
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "checkout_wait_ms_total": self._wait_total * 1000,
+                "checkout_wait_ms_max": self._wait_max * 1000,
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                conn.close()
+            self._idle.clear()
+            self._cond.notify_all()
+
 
 class Database:
-    def __init__(self):
+    def __init__(
+        self,
+        pooled: bool = False,
+        min_size: int = DB_POOL_MIN,
+        max_size: int = DB_POOL_MAX,
+        max_idle: float = DB_POOL_MAX_IDLE,
+    ):
         if not DATABASE_URL:
             raise ValueError("DATABASE_URL is not set. Cannot connect to database.")
-        # Connect to the database
-        self.conn = psycopg2.connect(DATABASE_URL)
-        # Initialize the necessary table
+        self.conn = None
+        self.pool = None
+        if pooled:
+            # Each call checks out its own connection, so queries from
+            # different threads run in parallel
+            self.pool = ConnectionPool(DATABASE_URL, min_size, max_size, max_idle)
+        else:
+            # Connect to the database
+            self.conn = psycopg2.connect(DATABASE_URL)
+        # Bring the schema up to date (a single version check when it already is)
         self.init_db()
 
+    @contextmanager
+    def _connection(self):
+        """Yields a connection: checked out of the pool in pooled mode,
+        otherwise the single shared connection."""
+        if self.pool is not None:
+            with self.pool.connection() as conn:
+                yield conn
+            return
+        try:
+            yield self.conn
+        except Exception:
+            if not self.conn.closed:
+                self.conn.rollback()  # Don't leave the shared connection in a failed transaction
+            raise
+
+    def pool_stats(self) -> dict:
+        """Returns pool usage statistics, or an empty dict if not pooled."""
+        return self.pool.stats() if self.pool is not None else {}
+
+    def _execute(self, cur, query, params=None):
+        """Executes a query, timing it for the slow-query log. A sample of slow
+        SELECTs is re-run under EXPLAIN and the plan kept for /slowplans."""
+        start = time.perf_counter()
+        try:
+            cur.execute(query, params)
+        finally:
+            seconds = time.perf_counter() - start
+            slow = observe_query(query, params, seconds)
+        if slow and should_explain(query):
+            self._explain(cur.connection, query, params, seconds)
+
+    def _explain(self, conn, query, params, seconds: float):
+        """Captures the plan of a slow query. Runs in a savepoint on a separate
+        cursor, so a failure can't abort the caller's transaction or results."""
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SAVEPOINT auto_explain")
+                try:
+                    cur.execute(explain_query(query), params)
+                    plan_lines = [row[0] for row in cur.fetchall()]
+                finally:
+                    cur.execute("ROLLBACK TO SAVEPOINT auto_explain")
+            record_plan(query, params, seconds, plan_lines)
+        except psycopg2.Error as e:
+            print(f"Could not capture plan for slow query: {e}")
+
     def init_db(self):
-        """Creates the students table if it doesn't exist."""
-        with self.conn.cursor() as cur:
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS students (
-                user_id BIGINT,
-                student_number TEXT,
-                student_name TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (user_id, student_number)
-            )
-            """)
-        self.conn.commit()
+        """Applies pending schema migrations (see migrate.py)."""
+        migrate(DATABASE_URL)
 
     def add_student(self, user_id: int, number: str, name: str):
         """Adds or updates a student record for a user."""
-        with self.conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO students (user_id, student_number, student_name)
-                VALUES (%s, %s, %s)
-                ON CONFLICT (user_id, student_number)
-                DO UPDATE SET student_name = EXCLUDED.student_name;
-                """,
-                (user_id, number, name),
-            )
-        self.conn.commit()
-
-    def get_students(self, user_id: int, order_by: str = "student_number"):
-        """Retrieves all students for a given user, ordered as specified."""
-        # Validate order_by to prevent SQL injection (allow only specific columns)
-        allowed_orders = {"student_number", "student_name"}
-        if order_by not in allowed_orders:
-            order_by = "student_number"  # Default to a safe value
-
-        # Use f-string carefully here because we validated order_by against a fixed set
-        query = f"""
-            SELECT student_number, student_name
-            FROM students
-            WHERE user_id = %s
-            ORDER BY {order_by}
-        """
-        with self.conn.cursor(cursor_factory=DictCursor) as cur:
-            cur.execute(query, (user_id,))
-            return cur.fetchall()
-
-    def find_students(self, user_id: int, query: str, order_by: str = "student_number"):
-        """Finds students by number or name, ordered as specified."""
-        allowed_orders = {"student_number", "student_name"}
-        if order_by not in allowed_orders:
-            order_by = "student_number"
-
-        sql_query = f"""
-            SELECT student_number, student_name FROM students
-            WHERE user_id = %s
-            AND (student_number = %s OR LOWER(student_name) LIKE %s)
-            ORDER BY {order_by};
-        """
-        with self.conn.cursor(cursor_factory=DictCursor) as cur:
-            cur.execute(sql_query, (user_id, query, f"%{query.lower()}%"))
-            return cur.fetchall()
+        with self._connection() as conn:
+            with conn.cursor() as cur:
+                self._execute(cur, UPSERT_STUDENT, (user_id, number, name))
+            conn.commit()
+
+    def add_students_bulk(self, user_id: int, rows) -> int:
+        """Adds or updates many (number, name) student records for a user
+        in a single statement and transaction. Returns the number of rows written."""
+        params = bulk_upsert_params(user_id, rows)
+        if not params[1]:
+            return 0
+        with self._connection() as conn:
+            with conn.cursor() as cur:
+                self._execute(cur, UPSERT_STUDENTS_BULK, params)
+                written = cur.rowcount
+            conn.commit()
+        return written
+
+    def import_students(self, user_id: int, rows) -> dict:
+        """Streams (number, name) rows into a staging table with COPY and merges
+        them into the user's students in one transaction.
+        Returns {"inserted": ..., "updated": ...}."""
+        with self._connection() as conn:
+            with conn.cursor() as cur:
+                self._execute(cur, CREATE_IMPORT_STAGING)
+                cur.copy_expert(
+                    COPY_IMPORT_STAGING + " WITH (FORMAT csv)", CsvRowStream(rows)
+                )
+                self._execute(cur, MERGE_IMPORT_STAGING, (user_id,))
+                inserted, updated = cur.fetchone()
+            conn.commit()
+        return {"inserted": inserted, "updated": updated}
+
+    def export_students(self, user_id: int, out):
+        """Streams the user's students as CSV (with header) into the binary file object out."""
+        with self._connection() as conn:
+            with conn.cursor() as cur:
+                # copy_expert doesn't take parameters, so bind user_id with mogrify
+                sql_query = cur.mogrify(EXPORT_STUDENTS, (user_id,)).decode()
+                cur.copy_expert(sql_query, out)
+
+    def get_students(
+        self,
+        user_id: int,
+        order_by: str = "student_number",
+        limit: int | None = None,
+        after: str | None = None,
+        before: str | None = None,
+    ):
+        """Retrieves students for a given user, ordered as specified.
+        For keyset pagination pass a limit and a student_number cursor as
+        after (next page) or before (previous page)."""
+        query, params, reverse = build_students_query(
+            user_id, order_by, limit, after, before
+        )
+        with self._connection() as conn:
+            with conn.cursor(cursor_factory=DictCursor) as cur:
+                self._execute(cur, query, params)
+                rows = cur.fetchall()
+        if reverse:
+            rows.reverse()  # Seeking backwards reads in descending order
+        return rows
+
+    def find_students(
+        self,
+        user_id: int,
+        query: str,
+        order_by: str = "student_number",
+        mode: str = "substring",
+        limit: int | None = None,
+    ):
+        """Finds students by number or name, ordered as specified.
+        mode is one of FIND_MODES: "substring" (default), "similarity" for
+        typo-tolerant ranked matches, or "fulltext" to match all query words."""
+        sql_query, params = build_find_query(user_id, query, order_by, mode, limit)
+        with self._connection() as conn:
+            with conn.cursor(cursor_factory=DictCursor) as cur:
+                self._execute(cur, sql_query, params)
+                return cur.fetchall()
 
     def delete_student(self, user_id: int, student_number: str) -> bool:
         """Deletes a specific student for a user by their number.
         Returns True if a student was deleted, False otherwise."""
         deleted_count = 0
-        with self.conn.cursor() as cur:
-            cur.execute(
-                """
-                DELETE FROM students
-                WHERE user_id = %s AND student_number = %s;
-                """,
-                (user_id, student_number),
-            )
-            deleted_count = cur.rowcount  # Check how many rows were affected
-        self.conn.commit()
+        with self._connection() as conn:
+            with conn.cursor() as cur:
+                self._execute(cur, DELETE_STUDENT, (user_id, student_number))
+                deleted_count = cur.rowcount  # Check how many rows were affected
+            conn.commit()
         return deleted_count > 0  # Return True if 1 row was deleted
 
     def update_student_name(
@@ -105,20 +549,18 @@ class Database:
         """Updates the name of a specific student for a user by their number.
         Returns True if a student was updated, False otherwise."""
         updated_count = 0
-        with self.conn.cursor() as cur:
-            cur.execute(
-                """
-                UPDATE students
-                SET student_name = %s
-                WHERE user_id = %s AND student_number = %s;
-                """,
-                (new_name, user_id, student_number),
-            )
-            updated_count = cur.rowcount  # Check how many rows were affected
-        self.conn.commit()
+        with self._connection() as conn:
+            with conn.cursor() as cur:
+                self._execute(
+                    cur, UPDATE_STUDENT_NAME, (new_name, user_id, student_number)
+                )
+                updated_count = cur.rowcount  # Check how many rows were affected
+            conn.commit()
         return updated_count > 0
 
     # Optional: Add a close method to close the connection when the bot stops
     def close(self):
+        if self.pool is not None:
+            self.pool.close()
         if self.conn:
             self.conn.close()
@@ -0,0 +1,136 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import Storage
+
+
+# Number of worker threads (and pooled connections) for ExecutorDatabase
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "8"))
+
+
+class ExecutorDatabase(Storage):
+    """Runs the methods of a sync database in a bounded thread pool.
+
+    A cheaper alternative to AsyncDatabase: every method is awaited by the
+    handlers, but the actual blocking call runs on a worker thread via
+    run_in_executor. factory builds the sync database (Database or
+    SQLiteDatabase); a Database should be pooled with one connection per
+    worker, so workers never wait on each other for a connection.
+    """
+
+    def __init__(self, factory, workers: int = DB_EXECUTOR_WORKERS):
+        self.factory = factory
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="db"
+        )
+        self.db = None
+        # Queue wait statistics (time between submit and a worker picking the call up)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._calls = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    async def _run(self, func, *args, **kwargs):
+        """Runs func on a worker thread, recording how long it sat in the queue."""
+        submitted = time.monotonic()
+        with self._lock:
+            self._queued += 1
+
+        def call():
+            waited = time.monotonic() - submitted
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._calls += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, call)
+
+    async def connect(self):
+        """Creates the sync database on a worker thread (connecting blocks)."""
+        self.db = await self._run(self.factory)
+
+    def executor_stats(self) -> dict:
+        """Returns queue statistics; a growing queue_wait means the executor is saturated."""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queued": self._queued,
+                "running": self._running,
+                "calls": self._calls,
+                "queue_wait_ms_total": self._wait_total * 1000,
+                "queue_wait_ms_max": self._wait_max * 1000,
+            }
+
+    def pool_stats(self) -> dict:
+        """Returns connection pool statistics merged with executor queue statistics."""
+        stats = self.db.pool_stats() if self.db is not None else {}
+        stats.update(
+            {f"executor_{key}": value for key, value in self.executor_stats().items()}
+        )
+        return stats
+
+    async def add_student(self, user_id: int, number: str, name: str):
+        return await self._run(self.db.add_student, user_id, number, name)
+
+    async def add_students_bulk(self, user_id: int, rows) -> int:
+        return await self._run(self.db.add_students_bulk, user_id, rows)
+
+    async def import_students(self, user_id: int, rows) -> dict:
+        # The rows iterator (file parsing included) is consumed on the worker thread
+        return await self._run(self.db.import_students, user_id, rows)
+
+    async def export_students(self, user_id: int, out):
+        return await self._run(self.db.export_students, user_id, out)
+
+    async def get_students(
+        self,
+        user_id: int,
+        order_by: str = "student_number",
+        limit: int | None = None,
+        after: str | None = None,
+        before: str | None = None,
+    ):
+        return await self._run(
+            self.db.get_students, user_id, order_by, limit, after, before
+        )
+
+    async def find_students(
+        self,
+        user_id: int,
+        query: str,
+        order_by: str = "student_number",
+        mode: str = "substring",
+        limit: int | None = None,
+    ):
+        return await self._run(
+            self.db.find_students, user_id, query, order_by, mode, limit
+        )
+
+    async def delete_student(self, user_id: int, student_number: str) -> bool:
+        return await self._run(self.db.delete_student, user_id, student_number)
+
+    async def update_student_name(
+        self, user_id: int, student_number: str, new_name: str
+    ) -> bool:
+        return await self._run(
+            self.db.update_student_name, user_id, student_number, new_name
+        )
+
+    async def close(self):
+        if self.db is not None:
+            await self._run(self.db.close)
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,134 @@
+import csv
+import io
+from itertools import islice
+
+
+# Rows parsed per worker-thread hop when an async backend imports a file
+IMPORT_BATCH_SIZE = 2000
+# Longest student number accepted; /list page buttons carry one in their
+# callback data, which Telegram limits to 64 bytes
+MAX_NUMBER_LENGTH = 32
+
+
+class CsvRowStream:
+    """Read-only file-like object that renders rows as CSV text on demand.
+
+    Lets psycopg2's copy_expert stream rows into COPY ... FROM STDIN
+    without materializing the whole file in memory.
+    """
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._out = io.StringIO()
+        self._writer = csv.writer(self._out, lineterminator="\n")
+        self._buffer = ""
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow(row)
+            if self._out.tell() >= 8192:
+                self._flush()
+        self._flush()
+        if size < 0:
+            chunk, self._buffer = self._buffer, ""
+        else:
+            chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+    def _flush(self):
+        self._buffer += self._out.getvalue()
+        self._out.seek(0)
+        self._out.truncate()
+
+
+def take_batch(rows, size: int = IMPORT_BATCH_SIZE) -> list:
+    """Returns the next size rows of the iterator rows (fewer at the end).
+    With lazy readers this is where the file actually gets parsed."""
+    return list(islice(rows, size))
+
+
+def iter_csv_rows(fileobj):
+    """Lazily yields raw rows from a binary CSV file object.
+    Accepts comma or semicolon delimiters (Excel uses ';' in some locales)."""
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.reader(text, dialect)
+
+
+def iter_xlsx_rows(fileobj):
+    """Lazily yields raw rows from the first sheet of a binary XLSX file object."""
+    try:
+        from openpyxl import load_workbook
+    except ImportError as e:
+        raise ImportError("XLSX import requires the openpyxl package.") from e
+
+    # read_only mode streams rows instead of loading the whole sheet
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _cell_text(value) -> str:
+    """Converts a CSV/XLSX cell to text (XLSX gives numbers as int/float)."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def is_valid_number(number: str) -> bool:
+    """True for a student number made of at most MAX_NUMBER_LENGTH digits."""
+    return number.isdigit() and len(number) <= MAX_NUMBER_LENGTH
+
+
+def clean_rows(raw_rows, stats: dict):
+    """Yields valid (number, name) pairs from raw rows.
+
+    Counts accepted and rejected rows in stats["accepted"] / stats["rejected"].
+    A first row whose number cell isn't numeric is treated as a header and
+    skipped; blank rows are skipped too. Numbers longer than
+    MAX_NUMBER_LENGTH digits are rejected.
+    """
+    stats.setdefault("accepted", 0)
+    stats.setdefault("rejected", 0)
+    for index, row in enumerate(raw_rows):
+        cells = [_cell_text(value) for value in (row or ())][:2]
+        if not any(cells):
+            continue
+        number = cells[0]
+        name = cells[1] if len(cells) > 1 else ""
+        if not number.isdigit():
+            if index > 0:
+                stats["rejected"] += 1
+            continue  # Otherwise it's the header row
+        if not name or len(number) > MAX_NUMBER_LENGTH:
+            stats["rejected"] += 1
+            continue
+        stats["accepted"] += 1
+        yield number, name
+
+
+def write_csv(out, rows):
+    """Writes (number, name) rows as CSV with the export header into the
+    binary file object out, in chunks, for backends without COPY."""
+    text = io.StringIO()
+    writer = csv.writer(text, lineterminator="\n")
+    writer.writerow(("student_number", "student_name"))
+    for row in rows:
+        writer.writerow(row)
+        if text.tell() >= 8192:
+            out.write(text.getvalue().encode("utf-8"))
+            text.seek(0)
+            text.truncate()
+    out.write(text.getvalue().encode("utf-8"))
@@ -0,0 +1,158 @@
+import os
+import random
+import time
+from collections import deque
+
+from metrics import REGISTRY
+
+
+# Queries slower than this are printed to the slow-query log
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+# Fraction of slow queries that are re-run under EXPLAIN (ANALYZE, BUFFERS)
+EXPLAIN_SAMPLE_RATE = float(os.getenv("EXPLAIN_SAMPLE_RATE", "0.1"))
+# How many recent slow plans are kept for /slowplans
+SLOW_PLAN_BUFFER_SIZE = int(os.getenv("SLOW_PLAN_BUFFER_SIZE", "20"))
+
+# Ring buffer of recent slow plans, newest last:
+# dicts with "at" (unix time), "ms", "query", "params" (shape only) and "plan"
+SLOW_PLANS = deque(maxlen=SLOW_PLAN_BUFFER_SIZE)
+
+# Storage methods that are timed
+INSTRUMENTED_METHODS = {
+    "add_student",
+    "add_students_bulk",
+    "import_students",
+    "export_students",
+    "get_students",
+    "find_students",
+    "delete_student",
+    "update_student_name",
+}
+
+METHOD_DURATION = REGISTRY.histogram(
+    "bot_db_method_duration_seconds", "Latency of storage method calls."
+)
+METHOD_ROWS = REGISTRY.counter(
+    "bot_db_method_rows_total", "Rows returned or written by storage method calls."
+)
+METHOD_ERRORS = REGISTRY.counter(
+    "bot_db_method_errors_total", "Storage method calls that raised an exception."
+)
+SLOW_QUERIES = REGISTRY.counter(
+    "bot_db_slow_queries_total", "Queries slower than SLOW_QUERY_THRESHOLD_MS."
+)
+
+
+def describe_params(params) -> str:
+    """Describes the shape of query parameters (types and list lengths) without
+    their values, so the slow-query log never contains names or numbers."""
+    if params is None:
+        return "()"
+
+    def describe(value):
+        if isinstance(value, (list, tuple)):
+            return f"{type(value).__name__}[{len(value)}]"
+        return type(value).__name__
+
+    return "(" + ", ".join(describe(value) for value in params) + ")"
+
+
+def observe_query(query: str, params, seconds: float) -> bool:
+    """Records one executed query; logs it if it was slow. Returns True if slow."""
+    if seconds * 1000 < SLOW_QUERY_THRESHOLD_MS:
+        return False
+    SLOW_QUERIES.inc()
+    one_line = " ".join(str(query).split())
+    print(
+        f"Slow query ({seconds * 1000:.1f} ms): {one_line} "
+        f"params={describe_params(params)}"
+    )
+    return True
+
+
+def should_explain(query: str) -> bool:
+    """Decides whether a slow query gets an EXPLAIN (ANALYZE, BUFFERS) run.
+    Only SELECTs qualify, because ANALYZE executes the statement again."""
+    if not str(query).lstrip().upper().startswith("SELECT"):
+        return False
+    return random.random() < EXPLAIN_SAMPLE_RATE
+
+
+def explain_query(query: str) -> str:
+    return "EXPLAIN (ANALYZE, BUFFERS) " + str(query)
+
+
+def record_plan(query: str, params, seconds: float, plan_lines):
+    """Stores an EXPLAIN plan in the SLOW_PLANS ring buffer."""
+    SLOW_PLANS.append(
+        {
+            "at": time.time(),
+            "ms": seconds * 1000,
+            "query": " ".join(str(query).split()),
+            "params": describe_params(params),
+            "plan": "\n".join(plan_lines),
+        }
+    )
+
+
+def _row_count(result) -> int | None:
+    """Rows touched by a storage call, judged from its return value."""
+    if isinstance(result, bool):
+        return int(result)
+    if isinstance(result, int):
+        return result
+    if isinstance(result, dict):
+        return sum(result.values())
+    if isinstance(result, list):
+        return len(result)
+    return None
+
+
+class InstrumentedStorage:
+    """Times every storage method call and counts its rows and errors.
+
+    Wraps any storage backend; methods outside INSTRUMENTED_METHODS are
+    passed through unchanged.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.backend = type(db).__name__
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if name not in INSTRUMENTED_METHODS:
+            return attr
+
+        async def timed(*args, **kwargs):
+            labels = {"method": name, "backend": self.backend}
+            start = time.perf_counter()
+            try:
+                result = await attr(*args, **kwargs)
+            except Exception:
+                METHOD_ERRORS.inc(**labels)
+                raise
+            finally:
+                METHOD_DURATION.observe(time.perf_counter() - start, **labels)
+            rows = _row_count(result)
+            if rows is not None:
+                METHOD_ROWS.inc(rows, **labels)
+            return result
+
+        return timed
+
+
+def register_stats_collector(db):
+    """Exports db.pool_stats() (pool, executor and cache stats) as gauges on every scrape."""
+
+    def collect():
+        samples = [
+            ({"stat": name}, value)
+            for name, value in db.pool_stats().items()
+            if isinstance(value, (int, float))
+        ]
+        return [
+            ("bot_db_stat", "Storage pool, executor and cache statistics.", "gauge", samples)
+        ]
+
+    REGISTRY.add_collector(collect)
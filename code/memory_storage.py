@@ -0,0 +1,91 @@
+from importer import write_csv
+from storage import Storage, row_sort_key, search_rows
+
+
+def _as_dicts(rows) -> list:
+    return [{"student_number": number, "student_name": name} for number, name in rows]
+
+
+class MemoryStorage(Storage):
+    """Pure in-memory storage backend: a dict of {number: name} per user.
+
+    Nothing is persisted, so it's meant for tests, benchmarks and trying the
+    bot out without a database. Sorting and search happen in Python and
+    follow the Postgres semantics as closely as practical.
+    """
+
+    def __init__(self):
+        self._students = {}  # user_id -> {student_number: student_name}
+
+    def _roster(self, user_id: int) -> dict:
+        return self._students.setdefault(user_id, {})
+
+    async def add_student(self, user_id: int, number: str, name: str):
+        self._roster(user_id)[number] = name
+
+    async def add_students_bulk(self, user_id: int, rows) -> int:
+        students = dict(rows)
+        self._roster(user_id).update(students)
+        return len(students)
+
+    async def import_students(self, user_id: int, rows) -> dict:
+        roster = self._roster(user_id)
+        imported = dict(rows)  # Later duplicates win
+        updated = sum(1 for number in imported if number in roster)
+        roster.update(imported)
+        return {"inserted": len(imported) - updated, "updated": updated}
+
+    async def export_students(self, user_id: int, out):
+        rows = sorted(self._roster(user_id).items(), key=row_sort_key("student_number"))
+        write_csv(out, rows)
+
+    async def get_students(
+        self,
+        user_id: int,
+        order_by: str = "student_number",
+        limit: int | None = None,
+        after: str | None = None,
+        before: str | None = None,
+    ):
+        roster = self._roster(user_id)
+        key = row_sort_key(order_by)
+        rows = sorted(roster.items(), key=key)
+
+        cursor = after if after is not None else before
+        if cursor is not None:
+            if cursor not in roster:
+                return []  # Like the SQL seek when the cursor row is gone
+            cursor_key = key((cursor, roster[cursor]))
+            if after is not None:
+                rows = [row for row in rows if key(row) > cursor_key]
+            else:
+                rows = [row for row in rows if key(row) < cursor_key]
+                if limit is not None:
+                    rows = rows[-limit:]  # The page right before the cursor
+                return _as_dicts(rows)
+        if limit is not None:
+            rows = rows[:limit]
+        return _as_dicts(rows)
+
+    async def find_students(
+        self,
+        user_id: int,
+        query: str,
+        order_by: str = "student_number",
+        mode: str = "substring",
+        limit: int | None = None,
+    ):
+        rows = search_rows(self._roster(user_id).items(), query, order_by, mode, limit)
+        return _as_dicts(rows)
+
+    async def delete_student(self, user_id: int, student_number: str) -> bool:
+        return self._roster(user_id).pop(student_number, None) is not None
+
+    async def update_student_name(
+        self, user_id: int, student_number: str, new_name: str
+    ) -> bool:
+        roster = self._roster(user_id)
+        if student_number not in roster:
+            return False
+        roster[student_number] = new_name
+        return True
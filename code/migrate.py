@@ -0,0 +1,145 @@
+"""Versioned schema migrations.
+
+Migrations are the numbered files in code/migrations (NNNN_description.sql),
+applied in order and recorded in the schema_version table. On startup only
+the current version is read; the migration path (and its advisory lock)
+runs only when files newer than that version exist.
+
+A file starting with "-- migrate: no-transaction" runs statement by
+statement outside a transaction, which CREATE INDEX CONCURRENTLY requires,
+and which lets a DO block COMMIT between batches of a large backfill.
+Run "python code/migrate.py" to migrate without starting the bot (e.g. in a
+release phase).
+"""
+
+import os
+import re
+
+import psycopg2
+from psycopg2 import errors
+
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE_RE = re.compile(r"^(\d+)_(\w+)\.sql$")
+NO_TRANSACTION_MARKER = "-- migrate: no-transaction"
+# Arbitrary key so only one process runs migrations at a time
+MIGRATION_LOCK_ID = 73012041
+
+CREATE_SCHEMA_VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+RECORD_MIGRATION = "INSERT INTO schema_version (version, name) VALUES (%s, %s)"
+
+
+def load_migrations() -> list[tuple[int, str, str]]:
+    """Returns (version, name, sql) for every migration file, ordered by version."""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = MIGRATION_FILE_RE.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, filename), encoding="utf-8") as f:
+            migrations.append((int(match.group(1)), match.group(2), f.read()))
+    migrations.sort()
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError("Duplicate migration version numbers in " + MIGRATIONS_DIR)
+    return migrations
+
+
+def split_statements(sql: str) -> list[str]:
+    """Splits a migration into statements. Only for no-transaction migrations;
+    semicolons inside $$-quoted bodies (DO blocks, functions) are kept, but
+    they must not appear inside string literals."""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    statements = []
+    current = ""
+    for index, chunk in enumerate("\n".join(lines).split("$$")):
+        if index % 2:
+            current += "$$" + chunk + "$$"  # Inside a body: keep as is
+            continue
+        *complete, rest = chunk.split(";")
+        for piece in complete:
+            statements.append(current + piece)
+            current = ""
+        current += rest
+    statements.append(current)
+    return [statement.strip() for statement in statements if statement.strip()]
+
+
+def current_version(conn) -> int:
+    """Returns the applied schema version, 0 for a database never migrated."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT MAX(version) FROM schema_version")
+            version = cur.fetchone()[0] or 0
+    except errors.UndefinedTable:
+        version = 0
+    conn.rollback()  # Don't leave the read transaction open
+    return version
+
+
+def apply_migration(conn, version: int, name: str, sql: str):
+    print(f"Applying migration {version:04d}_{name}...")
+    if sql.lstrip().startswith(NO_TRANSACTION_MARKER):
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                for statement in split_statements(sql):
+                    cur.execute(statement)
+                cur.execute(RECORD_MIGRATION, (version, name))
+        finally:
+            conn.autocommit = False
+    else:
+        with conn.cursor() as cur:
+            cur.execute(sql)
+            cur.execute(RECORD_MIGRATION, (version, name))
+        conn.commit()
+
+
+def migrate(dsn: str) -> int:
+    """Applies pending migrations and returns the resulting schema version."""
+    migrations = load_migrations()
+    latest = migrations[-1][0] if migrations else 0
+
+    conn = psycopg2.connect(dsn)
+    try:
+        # Fast path: one query when the schema is already up to date
+        version = current_version(conn)
+        if version >= latest:
+            return version
+
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+            cur.execute(CREATE_SCHEMA_VERSION_TABLE)
+        conn.commit()
+        try:
+            # Another process may have migrated while we waited for the lock
+            version = current_version(conn)
+            for migration_version, name, sql in migrations:
+                if migration_version > version:
+                    apply_migration(conn, migration_version, name, sql)
+                    version = migration_version
+        finally:
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+        return version
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        raise ValueError("DATABASE_URL is not set. Cannot run migrations.")
+    print(f"Schema is at version {migrate(database_url)}.")
@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS students (
+    user_id BIGINT,
+    student_number TEXT,
+    student_name TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, student_number)
+);
@@ -0,0 +1,18 @@
+-- Full-text search over names. The "simple" config doesn't stem, which suits names.
+-- student_name_tsv is a plain nullable column kept up to date by a trigger:
+-- adding it doesn't rewrite the table, unlike a stored generated column,
+-- so students is never locked for long. 0004 backfills existing rows.
+CREATE OR REPLACE FUNCTION students_set_name_tsv() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.student_name_tsv := to_tsvector('simple', COALESCE(NEW.student_name, ''));
+    RETURN NEW;
+END;
+$$;
+
+ALTER TABLE students ADD COLUMN IF NOT EXISTS student_name_tsv tsvector;
+
+DROP TRIGGER IF EXISTS students_name_tsv_trg ON students;
+CREATE TRIGGER students_name_tsv_trg
+BEFORE INSERT OR UPDATE OF student_name ON students
+FOR EACH ROW EXECUTE FUNCTION students_set_name_tsv();
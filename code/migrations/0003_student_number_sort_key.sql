@@ -0,0 +1,24 @@
+-- student_number is TEXT, so ORDER BY student_number puts "100" before "20".
+-- student_number_key holds the numeric value and is kept up to date by a
+-- trigger. Adding a nullable column without a default doesn't rewrite the
+-- table, unlike a stored generated column. Non-numeric numbers get -1.
+-- Existing rows are backfilled in batches by 0004, outside this transaction.
+CREATE OR REPLACE FUNCTION student_number_sort_key(number TEXT) RETURNS NUMERIC
+LANGUAGE SQL IMMUTABLE AS $$
+    SELECT CASE WHEN number ~ '^[0-9]+$' THEN number::NUMERIC ELSE -1 END
+$$;
+
+CREATE OR REPLACE FUNCTION students_set_number_key() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.student_number_key := student_number_sort_key(NEW.student_number);
+    RETURN NEW;
+END;
+$$;
+
+ALTER TABLE students ADD COLUMN IF NOT EXISTS student_number_key NUMERIC;
+
+DROP TRIGGER IF EXISTS students_number_key_trg ON students;
+CREATE TRIGGER students_number_key_trg
+BEFORE INSERT OR UPDATE OF student_number ON students
+FOR EACH ROW EXECUTE FUNCTION students_set_number_key();
@@ -0,0 +1,46 @@
+-- migrate: no-transaction
+-- Backfill student_name_tsv and student_number_key for rows written before
+-- the 0002 and 0003 triggers, in primary key order, committing every 5000
+-- rows so no lock is held for long. Both columns are set in one pass, and
+-- before any secondary index exists, so each row is rewritten once and
+-- only the primary key index sees the new row versions.
+-- Until it's done, such rows sort as NULL (last) in ID order.
+DO $$
+DECLARE
+    from_user BIGINT := -9223372036854775808;
+    from_number TEXT := '';
+    to_user BIGINT;
+    to_number TEXT;
+BEGIN
+    LOOP
+        to_user := NULL;
+        SELECT user_id, student_number INTO to_user, to_number
+        FROM students
+        WHERE (user_id, student_number) > (from_user, from_number)
+        ORDER BY user_id, student_number
+        OFFSET 4999 LIMIT 1;
+
+        IF to_user IS NULL THEN
+            -- Last (partial) batch
+            UPDATE students
+            SET student_name_tsv = to_tsvector('simple', COALESCE(student_name, '')),
+                student_number_key = student_number_sort_key(student_number)
+            WHERE (user_id, student_number) > (from_user, from_number)
+            AND (student_name_tsv IS NULL OR student_number_key IS NULL);
+            COMMIT;
+            EXIT;
+        END IF;
+
+        UPDATE students
+        SET student_name_tsv = to_tsvector('simple', COALESCE(student_name, '')),
+            student_number_key = student_number_sort_key(student_number)
+        WHERE (user_id, student_number) > (from_user, from_number)
+        AND (user_id, student_number) <= (to_user, to_number)
+        AND (student_name_tsv IS NULL OR student_number_key IS NULL);
+        COMMIT;
+
+        from_user := to_user;
+        from_number := to_number;
+    END LOOP;
+END
+$$;
@@ -0,0 +1,10 @@
+-- migrate: no-transaction
+-- Trigram index so substring and fuzzy name searches don't scan the table.
+-- A failed CONCURRENTLY build leaves an invalid index behind, so drop any
+-- leftover first; this migration only re-runs if it never completed.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+DROP INDEX CONCURRENTLY IF EXISTS students_name_trgm_idx;
+
+CREATE INDEX CONCURRENTLY students_name_trgm_idx
+ON students USING GIN (LOWER(student_name) gin_trgm_ops);
@@ -0,0 +1,6 @@
+-- migrate: no-transaction
+-- Full-text index over the student_name_tsv column from 0002.
+DROP INDEX CONCURRENTLY IF EXISTS students_name_tsv_idx;
+
+CREATE INDEX CONCURRENTLY students_name_tsv_idx
+ON students USING GIN (student_name_tsv);
@@ -0,0 +1,13 @@
+-- migrate: no-transaction
+-- Covering indexes so /list, in both sort orders and for keyset pages, can
+-- be an index-only scan: every selected column is in the index, in ORDER BY
+-- order. ID order reads student_number_key (0003), name order student_name.
+DROP INDEX CONCURRENTLY IF EXISTS students_user_number_key_cov_idx;
+
+CREATE INDEX CONCURRENTLY students_user_number_key_cov_idx
+ON students (user_id, student_number_key, student_number) INCLUDE (student_name);
+
+DROP INDEX CONCURRENTLY IF EXISTS students_user_name_idx;
+
+CREATE INDEX CONCURRENTLY students_user_name_idx
+ON students (user_id, student_name, student_number);
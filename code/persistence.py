@@ -0,0 +1,228 @@
+import asyncio
+import json
+import os
+
+import psycopg
+from telegram.ext import BasePersistence, PersistenceInput
+
+from database import DATABASE_URL
+from migrate import migrate
+
+
+# How often the Application hands changed user_data/conversations to the
+# persistence (PTB's update_interval); shutdown always flushes everything
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", "10"))
+# Changes arriving within this many seconds of each other share one transaction
+PERSISTENCE_FLUSH_DELAY = float(os.getenv("PERSISTENCE_FLUSH_DELAY", "1"))
+
+SELECT_USER_DATA = "SELECT data FROM bot_user_data WHERE user_id = %s"
+
+SELECT_CONVERSATIONS = "SELECT key, state FROM bot_conversations WHERE name = %s"
+
+UPSERT_USER_DATA = """
+    INSERT INTO bot_user_data (user_id, data)
+    SELECT * FROM unnest(%s::bigint[], %s::text[]::jsonb[])
+    ON CONFLICT (user_id)
+    DO UPDATE SET data = EXCLUDED.data, updated_at = now()
+"""
+
+DELETE_USER_DATA = "DELETE FROM bot_user_data WHERE user_id = ANY(%s)"
+
+UPSERT_CONVERSATIONS = """
+    INSERT INTO bot_conversations (name, key, state)
+    SELECT * FROM unnest(%s::text[], %s::text[], %s::text[]::jsonb[])
+    ON CONFLICT (name, key)
+    DO UPDATE SET state = EXCLUDED.state, updated_at = now()
+"""
+
+DELETE_CONVERSATIONS = """
+    DELETE FROM bot_conversations
+    WHERE (name, key) IN (SELECT * FROM unnest(%s::text[], %s::text[]))
+"""
+
+
+class PostgresPersistence(BasePersistence):
+    """Keeps context.user_data and ConversationHandler states in Postgres, so
+    deploys don't drop half-finished /add, /import and /delete flows or sort
+    preferences.
+
+    Only user_data and conversations are stored. Conversation states are
+    loaded at startup; a user's user_data is loaded the first time one of
+    their updates arrives (PTB calls refresh_user_data before handling it),
+    so startup doesn't read every user's row. The Application already
+    batches changes: it hands over the users and conversations touched since
+    the last round every PERSISTENCE_INTERVAL seconds. Those changes are
+    buffered here (as JSON, i.e. a snapshot of the value at hand-over time)
+    and written by a single debounced flush, so a round costs one
+    transaction no matter how many users it covers.
+    """
+
+    def __init__(self):
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=False, user_data=True, callback_data=False
+            ),
+            update_interval=PERSISTENCE_INTERVAL,
+        )
+        if not DATABASE_URL:
+            raise ValueError("DATABASE_URL is not set. Cannot persist bot data.")
+        self.conn = None
+        self._pending_user_data = {}  # user_id -> JSON text, None to delete
+        self._pending_conversations = {}  # (name, key JSON) -> state JSON, None to delete
+        self._flush_task = None
+        self._flush_lock = asyncio.Lock()
+        # Serializes transactions on the one connection (lazy loads and flushes)
+        self._conn_lock = asyncio.Lock()
+        self._loaded_users = set()  # Users whose user_data has been loaded
+
+    async def _connection(self) -> psycopg.AsyncConnection:
+        """Opens the connection on first use. The Application loads persisted
+        data before post_init runs, so this migrates the schema itself."""
+        if self.conn is None or self.conn.closed:
+            await asyncio.to_thread(migrate, DATABASE_URL)
+            self.conn = await psycopg.AsyncConnection.connect(DATABASE_URL)
+        return self.conn
+
+    # --- Loading ---
+
+    async def get_user_data(self) -> dict:
+        return {}  # Loaded per user by refresh_user_data
+
+    async def get_conversations(self, name: str) -> dict:
+        async with self._conn_lock:
+            conn = await self._connection()
+            async with conn.transaction():
+                cur = await conn.execute(SELECT_CONVERSATIONS, (name,))
+                return {tuple(json.loads(key)): state async for key, state in cur}
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    # --- Buffering changes ---
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        # Empty user_data is the default, so there's no need to keep a row for it
+        self._pending_user_data[user_id] = json.dumps(data) if data else None
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._loaded_users.add(user_id)  # Nothing stored is wanted any more
+        self._pending_user_data[user_id] = None
+        self._schedule_flush()
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        state = None if new_state is None else json.dumps(new_state)
+        self._pending_conversations[(name, json.dumps(list(key)))] = state
+        self._schedule_flush()
+
+    async def update_chat_data(self, chat_id: int, data) -> None:
+        pass
+
+    async def update_bot_data(self, data) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data) -> None:
+        """Loads the user's stored user_data into the Application's mapping
+        the first time they're seen. Afterwards this process is the only
+        writer, so memory is never stale. A failed load raises rather than
+        let the handler run (and later persist) without the stored data."""
+        if user_id in self._loaded_users:
+            return
+        async with self._conn_lock:
+            conn = await self._connection()
+            async with conn.transaction():
+                cur = await conn.execute(SELECT_USER_DATA, (user_id,))
+                row = await cur.fetchone()
+        self._loaded_users.add(user_id)
+        if row is not None:
+            # psycopg already decodes jsonb into Python objects
+            for key, value in row[0].items():
+                user_data.setdefault(key, value)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
+
+    # --- Writing ---
+
+    def _schedule_flush(self):
+        """Starts a flush PERSISTENCE_FLUSH_DELAY from now unless one is pending."""
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(PERSISTENCE_FLUSH_DELAY)
+        try:
+            await self._write_pending()
+        except psycopg.Error as e:
+            # The changes were put back; the next round retries them
+            print(f"Error persisting bot data: {e}")
+
+    async def _write_pending(self):
+        """Writes all buffered changes in one transaction. On failure, puts
+        back the changes that haven't been superseded meanwhile."""
+        async with self._flush_lock:
+            user_data, self._pending_user_data = self._pending_user_data, {}
+            conversations, self._pending_conversations = self._pending_conversations, {}
+            if not user_data and not conversations:
+                return
+            try:
+                await self._write(user_data, conversations)
+            except BaseException:  # Including cancellation by flush()
+                self._pending_user_data = {**user_data, **self._pending_user_data}
+                self._pending_conversations = {
+                    **conversations,
+                    **self._pending_conversations,
+                }
+                raise
+
+    async def _write(self, user_data: dict, conversations: dict):
+        upserts = [(user_id, data) for user_id, data in user_data.items() if data]
+        deletes = [user_id for user_id, data in user_data.items() if data is None]
+        conv_upserts = [(*key, state) for key, state in conversations.items() if state]
+        conv_deletes = [key for key, state in conversations.items() if state is None]
+
+        async with self._conn_lock:
+            conn = await self._connection()
+            async with conn.transaction():
+                if upserts:
+                    await conn.execute(
+                        UPSERT_USER_DATA, [list(col) for col in zip(*upserts)]
+                    )
+                if deletes:
+                    await conn.execute(DELETE_USER_DATA, (deletes,))
+                if conv_upserts:
+                    await conn.execute(
+                        UPSERT_CONVERSATIONS, [list(col) for col in zip(*conv_upserts)]
+                    )
+                if conv_deletes:
+                    await conn.execute(
+                        DELETE_CONVERSATIONS, [list(col) for col in zip(*conv_deletes)]
+                    )
+
+    async def flush(self) -> None:
+        """Writes everything still buffered and closes the connection.
+        Called by the Application on shutdown."""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        try:
+            await self._write_pending()
+        except psycopg.Error as e:
+            print(f"Error persisting bot data on shutdown: {e}")
+        if self.conn is not None:
+            await self.conn.close()
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import REGISTRY
+
+
+# Telegram's documented flood limits: about 30 messages per second overall,
+# one per second in a private chat and 20 per minute in a group
+GLOBAL_RATE_LIMIT = float(os.getenv("GLOBAL_RATE_LIMIT", "30"))
+CHAT_RATE_LIMIT = float(os.getenv("CHAT_RATE_LIMIT", "1"))
+GROUP_RATE_LIMIT = float(os.getenv("GROUP_RATE_LIMIT", str(20 / 60)))
+# Short bursts per chat that Telegram tolerates (e.g. a reply right after an edit)
+CHAT_BURST = int(os.getenv("CHAT_BURST", "3"))
+# Idle chats' buckets are dropped once this many chats are tracked
+CHAT_STATE_PRUNE_SIZE = 1000
+# How often a request that got RetryAfter is retried before giving up
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "3"))
+
+WAIT_SECONDS = REGISTRY.histogram(
+    "bot_outgoing_wait_seconds",
+    "Time outgoing requests waited for their chat's turn and rate limit tokens.",
+)
+RETRY_AFTERS = REGISTRY.counter(
+    "bot_outgoing_retry_after_total", "RetryAfter (429) responses from Telegram."
+)
+DROPPED = REGISTRY.counter(
+    "bot_outgoing_dropped_total", "Requests given up on after RATE_LIMIT_MAX_RETRIES."
+)
+
+
+class TokenBucket:
+    """Allows rate requests per second on average, with bursts up to capacity.
+    Waiters are served in FIFO order."""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def is_full(self) -> bool:
+        """True once the bucket has refilled, i.e. forgetting it changes nothing."""
+        elapsed = time.monotonic() - self.updated
+        return self.tokens + elapsed * self.rate >= self.capacity
+
+
+class OutgoingRateLimiter(BaseRateLimiter):
+    """Throttles outgoing Bot API requests to stay under Telegram's flood limits.
+
+    Requests addressed to a chat (reply_text, edit_message_text, ...) queue
+    per chat: they go out one at a time in the order they were made, each
+    taking a token from the chat's bucket and then from the global bucket.
+    Requests without a chat (getUpdates, answerCallbackQuery) aren't throttled.
+    A RetryAfter pauses all requests for the time Telegram asks for, and the
+    request is retried up to RATE_LIMIT_MAX_RETRIES times (or as many as the
+    rate_limit_args of the call say).
+    """
+
+    def __init__(self):
+        self._global = TokenBucket(GLOBAL_RATE_LIMIT, GLOBAL_RATE_LIMIT)
+        self._chats = {}  # chat_id -> [asyncio.Lock, TokenBucket, requests queued]
+        self._prune_at = CHAT_STATE_PRUNE_SIZE
+        self._paused_until = 0.0
+        # Gauge values, kept as plain ints on the event loop: the metrics
+        # thread must not iterate _chats while the loop changes it
+        self._queued_requests = 0
+        self._queued_chats = 0
+        REGISTRY.add_collector(self._collect)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _collect(self):
+        return [
+            (
+                "bot_outgoing_queue_depth",
+                "Outgoing requests queued or being sent.",
+                "gauge",
+                [({}, self._queued_requests)],
+            ),
+            (
+                "bot_outgoing_queued_chats",
+                "Chats with outgoing requests queued or being sent.",
+                "gauge",
+                [({}, self._queued_chats)],
+            ),
+        ]
+
+    def _chat_entry(self, chat_id):
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            if len(self._chats) >= self._prune_at:
+                self._prune()
+            # Negative ids are groups and channels
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = GROUP_RATE_LIMIT if is_group else CHAT_RATE_LIMIT
+            entry = [asyncio.Lock(), TokenBucket(rate, CHAT_BURST), 0]
+            self._chats[chat_id] = entry
+        return entry
+
+    def _prune(self):
+        """Forgets chats with nothing queued whose bucket has refilled."""
+        for chat_id, (_, bucket, queued) in list(self._chats.items()):
+            if not queued and bucket.is_full():
+                del self._chats[chat_id]
+        self._prune_at = max(CHAT_STATE_PRUNE_SIZE, 2 * len(self._chats))
+
+    async def _wait_for_pause(self):
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def process_request(
+        self, callback, args, kwargs, endpoint, data, rate_limit_args
+    ):
+        max_retries = rate_limit_args
+        if max_retries is None:
+            max_retries = RATE_LIMIT_MAX_RETRIES
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            return await self._send(callback, args, kwargs, endpoint, max_retries)
+
+        entry = self._chat_entry(chat_id)
+        entry[2] += 1
+        self._queued_requests += 1
+        if entry[2] == 1:
+            self._queued_chats += 1
+        start = time.perf_counter()
+        try:
+            # asyncio.Lock wakes waiters in FIFO order, which keeps per-chat send order
+            async with entry[0]:
+                await entry[1].acquire()
+                await self._wait_for_pause()
+                await self._global.acquire()
+                WAIT_SECONDS.observe(time.perf_counter() - start)
+                return await self._send(callback, args, kwargs, endpoint, max_retries)
+        finally:
+            entry[2] -= 1
+            self._queued_requests -= 1
+            if entry[2] == 0:
+                self._queued_chats -= 1
+
+    async def _send(self, callback, args, kwargs, endpoint, max_retries):
+        """Calls the API, retrying after RetryAfter; the chat's lock stays held
+        meanwhile, so later messages to the chat can't overtake this one."""
+        for attempt in range(max_retries + 1):
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                RETRY_AFTERS.inc()
+                if attempt == max_retries:
+                    DROPPED.inc()
+                    raise
+                retry_after = e.retry_after
+                if hasattr(retry_after, "total_seconds"):
+                    retry_after = retry_after.total_seconds()
+                print(f"Flood control on {endpoint}, retrying in {retry_after} s")
+                # Telegram's limit is bot-wide, so hold back every request
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + retry_after + 0.1
+                )
+                await self._wait_for_pause()
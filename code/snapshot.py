@@ -0,0 +1,124 @@
+import os
+import time
+from array import array
+from collections import OrderedDict
+
+from storage import number_sort_key
+
+
+# Rosters up to this many students get a snapshot; bigger ones page through the database
+SNAPSHOT_MAX_ROWS = int(os.getenv("SNAPSHOT_MAX_ROWS", "2000"))
+# How many /list messages keep a snapshot, and for how many seconds
+SNAPSHOT_MAX_COUNT = int(os.getenv("SNAPSHOT_MAX_COUNT", "256"))
+SNAPSHOT_TTL = float(os.getenv("SNAPSHOT_TTL", "600"))
+
+
+def _sort_key(rows, sort_order: str):
+    """Returns a key function over row indices for the given sort order."""
+    if sort_order == "student_name":
+        return lambda i: (rows[i][1].casefold(), rows[i][0])
+    return lambda i: (number_sort_key(rows[i][0]), rows[i][0])
+
+
+class RosterSnapshot:
+    """Compact copy of the roster shown in one /list message, plus its current view.
+
+    Rows are kept as (number, name) tuples. Each sort order is stored as an
+    index permutation computed once, so re-sorting, reversing and paging
+    never touch the database. version is the roster version the rows were
+    read at (None if unknown) and loaded_order the order they arrived in.
+    """
+
+    __slots__ = (
+        "rows",
+        "_orders",
+        "sort_order",
+        "reverse",
+        "offset",
+        "version",
+        "loaded_order",
+    )
+
+    def __init__(self, students, sort_order: str, version: int | None = None):
+        self.rows = tuple(
+            (student["student_number"], student["student_name"]) for student in students
+        )
+        # The rows arrive already sorted by sort_order, so that order is the identity
+        self._orders = {sort_order: range(len(self.rows))}
+        self.loaded_order = sort_order
+        self.version = version
+        self.sort_order = sort_order
+        self.reverse = False
+        self.offset = 0
+
+    def _order(self, sort_order: str):
+        order = self._orders.get(sort_order)
+        if order is None:
+            order = array(
+                "I", sorted(range(len(self.rows)), key=_sort_key(self.rows, sort_order))
+            )
+            self._orders[sort_order] = order
+        return order
+
+    def page(self, limit: int) -> tuple[list, bool, bool]:
+        """Returns the students of the current view page as (students, has_prev, has_next)."""
+        order = self._order(self.sort_order)
+        total = len(order)
+        if self.offset >= total:
+            # Past the end: show the last page, aligned like the page buttons
+            self.offset = max(total - 1, 0) // limit * limit
+        positions = range(self.offset, min(self.offset + limit, total))
+        if self.reverse:
+            indices = [order[total - 1 - position] for position in positions]
+        else:
+            indices = [order[position] for position in positions]
+        students = [
+            {"student_number": self.rows[i][0], "student_name": self.rows[i][1]}
+            for i in indices
+        ]
+        return students, self.offset > 0, self.offset + limit < total
+
+
+class SnapshotStore:
+    """LRU store of RosterSnapshots keyed by (chat_id, message_id), with a TTL."""
+
+    def __init__(self, max_count: int = SNAPSHOT_MAX_COUNT, ttl: float = SNAPSHOT_TTL):
+        self.max_count = max_count
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, snapshot), LRU first
+        # user_id -> roster version known to exceed SNAPSHOT_MAX_ROWS
+        self._oversized = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, snapshot = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return snapshot
+
+    def discard(self, key):
+        self._entries.pop(key, None)
+
+    def is_oversized(self, user_id: int, version: int | None) -> bool:
+        """True if the user's roster at this version was too big for a snapshot."""
+        return version is not None and self._oversized.get(user_id) == version
+
+    def mark_oversized(self, user_id: int, version: int | None):
+        """Remembers that the roster at this version is too big, so /list
+        doesn't read it again until a write changes the version."""
+        if version is None:
+            return
+        self._oversized.pop(user_id, None)
+        self._oversized[user_id] = version
+        while len(self._oversized) > self.max_count:
+            self._oversized.popitem(last=False)
+
+    def put(self, key, snapshot: RosterSnapshot):
+        self._entries.pop(key, None)
+        self._entries[key] = (time.monotonic() + self.ttl, snapshot)
+        while len(self._entries) > self.max_count:
+            self._entries.popitem(last=False)
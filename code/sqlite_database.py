@@ -0,0 +1,237 @@
+import sqlite3
+import threading
+
+from importer import write_csv
+from storage import like_pattern, search_rows
+
+
+# Same columns and indexes as the Postgres schema after its migrations.
+# student_number_key is a generated column here instead of a trigger.
+SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS students (
+        user_id INTEGER,
+        student_number TEXT,
+        student_name TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        student_number_key INTEGER GENERATED ALWAYS AS (
+            CASE WHEN student_number <> '' AND student_number NOT GLOB '*[^0-9]*'
+            THEN CAST(student_number AS INTEGER) ELSE -1 END
+        ) VIRTUAL,
+        PRIMARY KEY (user_id, student_number)
+    );
+    CREATE INDEX IF NOT EXISTS students_user_number_key_idx
+    ON students (user_id, student_number_key, student_number, student_name);
+    CREATE INDEX IF NOT EXISTS students_user_name_idx
+    ON students (user_id, student_name, student_number);
+"""
+
+SORT_COLUMNS = {
+    "student_number": "student_number_key",
+    "student_name": "student_name",
+}
+
+UPSERT_STUDENT = """
+    INSERT INTO students (user_id, student_number, student_name)
+    VALUES (?, ?, ?)
+    ON CONFLICT (user_id, student_number)
+    DO UPDATE SET student_name = excluded.student_name
+"""
+
+SELECT_STUDENTS = """
+    SELECT student_number, student_name
+    FROM students
+    WHERE user_id = ?
+    {seek}
+    ORDER BY {sort_column} {direction}, student_number {direction}
+    LIMIT ?
+"""
+
+SEEK_CONDITION = """
+    AND ({sort_column}, student_number) {op} (
+        SELECT {sort_column}, student_number FROM students
+        WHERE user_id = ? AND student_number = ?
+    )
+"""
+
+FIND_STUDENTS = """
+    SELECT student_number, student_name FROM students
+    WHERE user_id = ?
+    AND (student_number = ? OR LOWER(student_name) LIKE ? ESCAPE '\\')
+    ORDER BY {sort_column}, student_number
+    LIMIT ?
+"""
+
+
+class SQLiteDatabase:
+    """Sync SQLite storage with the same method surface as Database.
+
+    Meant for small deployments and local runs without Postgres; wrap it in
+    ExecutorDatabase so handlers can await it. Each worker thread gets its
+    own connection. The "similarity" and "fulltext" search modes are done
+    in Python over the user's rows, since SQLite has no pg_trgm or tsvector.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self.init_db()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Returns this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def pool_stats(self) -> dict:
+        return {}
+
+    def init_db(self):
+        """Creates the students table and its indexes if they don't exist."""
+        self._connection().executescript(SQLITE_SCHEMA)
+
+    def add_student(self, user_id: int, number: str, name: str):
+        conn = self._connection()
+        with conn:
+            conn.execute(UPSERT_STUDENT, (user_id, number, name))
+
+    def add_students_bulk(self, user_id: int, rows) -> int:
+        students = dict(rows)  # Later duplicates win, like the Postgres version
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                UPSERT_STUDENT,
+                ((user_id, number, name) for number, name in students.items()),
+            )
+        return len(students)
+
+    def import_students(self, user_id: int, rows) -> dict:
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "CREATE TEMP TABLE students_import "
+                "(line_no INTEGER PRIMARY KEY, student_number TEXT, student_name TEXT)"
+            )
+            try:
+                conn.executemany(
+                    "INSERT INTO students_import (student_number, student_name) VALUES (?, ?)",
+                    rows,
+                )
+                # Keep the last line for each number
+                latest = (
+                    "SELECT student_number, student_name FROM students_import "
+                    "WHERE line_no IN "
+                    "(SELECT MAX(line_no) FROM students_import GROUP BY student_number)"
+                )
+                total = conn.execute(f"SELECT COUNT(*) FROM ({latest})").fetchone()[0]
+                updated = conn.execute(
+                    f"SELECT COUNT(*) FROM ({latest}) AS i JOIN students AS s "
+                    "ON s.user_id = ? AND s.student_number = i.student_number",
+                    (user_id,),
+                ).fetchone()[0]
+                # "WHERE true" lets SQLite parse ON CONFLICT after a SELECT
+                conn.execute(
+                    "INSERT INTO students (user_id, student_number, student_name) "
+                    f"SELECT ?, student_number, student_name FROM ({latest}) WHERE true "
+                    "ON CONFLICT (user_id, student_number) "
+                    "DO UPDATE SET student_name = excluded.student_name",
+                    (user_id,),
+                )
+            finally:
+                conn.execute("DROP TABLE students_import")
+        return {"inserted": total - updated, "updated": updated}
+
+    def export_students(self, user_id: int, out):
+        cur = self._connection().execute(
+            "SELECT student_number, student_name FROM students WHERE user_id = ? "
+            "ORDER BY student_number_key, student_number",
+            (user_id,),
+        )
+        write_csv(out, (tuple(row) for row in cur))
+
+    def get_students(
+        self,
+        user_id: int,
+        order_by: str = "student_number",
+        limit: int | None = None,
+        after: str | None = None,
+        before: str | None = None,
+    ):
+        # Formatting is safe here because the column comes from a fixed mapping
+        sort_column = SORT_COLUMNS.get(order_by, "student_number_key")
+        direction = "DESC" if before is not None else "ASC"
+        params = [user_id]
+        seek = ""
+        cursor = after if after is not None else before
+        if cursor is not None:
+            op = ">" if after is not None else "<"
+            seek = SEEK_CONDITION.format(sort_column=sort_column, op=op)
+            params += [user_id, cursor]
+        params.append(-1 if limit is None else limit)  # SQLite: -1 means no limit
+        query = SELECT_STUDENTS.format(
+            seek=seek, sort_column=sort_column, direction=direction
+        )
+        rows = self._connection().execute(query, params).fetchall()
+        if before is not None:
+            rows.reverse()  # Seeking backwards reads in descending order
+        return rows
+
+    def find_students(
+        self,
+        user_id: int,
+        query: str,
+        order_by: str = "student_number",
+        mode: str = "substring",
+        limit: int | None = None,
+    ):
+        conn = self._connection()
+        if mode in ("similarity", "fulltext"):
+            rows = conn.execute(
+                "SELECT student_number, student_name FROM students WHERE user_id = ?",
+                (user_id,),
+            )
+            matches = search_rows((tuple(row) for row in rows), query, order_by, mode, limit)
+            return [
+                {"student_number": number, "student_name": name}
+                for number, name in matches
+            ]
+        sort_column = SORT_COLUMNS.get(order_by, "student_number_key")
+        return conn.execute(
+            FIND_STUDENTS.format(sort_column=sort_column),
+            (user_id, query, like_pattern(query), -1 if limit is None else limit),
+        ).fetchall()
+
+    def delete_student(self, user_id: int, student_number: str) -> bool:
+        conn = self._connection()
+        with conn:
+            cur = conn.execute(
+                "DELETE FROM students WHERE user_id = ? AND student_number = ?",
+                (user_id, student_number),
+            )
+        return cur.rowcount > 0
+
+    def update_student_name(
+        self, user_id: int, student_number: str, new_name: str
+    ) -> bool:
+        conn = self._connection()
+        with conn:
+            cur = conn.execute(
+                "UPDATE students SET student_name = ? "
+                "WHERE user_id = ? AND student_number = ?",
+                (new_name, user_id, student_number),
+            )
+        return cur.rowcount > 0
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
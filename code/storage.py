@@ -0,0 +1,196 @@
+import os
+import re
+from abc import ABC, abstractmethod
+from difflib import SequenceMatcher
+
+
+# Minimum similarity for find_students(mode="similarity") in backends without
+# pg_trgm; the same default as pg_trgm's word_similarity_threshold
+SIMILARITY_THRESHOLD = 0.6
+
+WORD_RE = re.compile(r"\w+")
+
+
+class Storage(ABC):
+    """Interface every storage backend implements; these are the calls the
+    handlers await.
+
+    Rows returned by get_students and find_students support
+    row["student_number"] and row["student_name"].
+    """
+
+    async def connect(self):
+        """Prepares the backend (connections, schema). Awaited once at startup."""
+
+    async def close(self):
+        """Releases the backend's resources. Awaited once at shutdown."""
+
+    def pool_stats(self) -> dict:
+        """Returns backend statistics for /dbstats, empty if there are none."""
+        return {}
+
+    @abstractmethod
+    async def add_student(self, user_id: int, number: str, name: str):
+        """Adds or updates a student record for a user."""
+
+    @abstractmethod
+    async def add_students_bulk(self, user_id: int, rows) -> int:
+        """Adds or updates many (number, name) records. Returns the number written."""
+
+    @abstractmethod
+    async def import_students(self, user_id: int, rows) -> dict:
+        """Merges streamed (number, name) rows; later duplicates win.
+        Returns {"inserted": ..., "updated": ...}."""
+
+    @abstractmethod
+    async def export_students(self, user_id: int, out):
+        """Writes the user's students as CSV with a header into the binary file out."""
+
+    @abstractmethod
+    async def get_students(
+        self,
+        user_id: int,
+        order_by: str = "student_number",
+        limit: int | None = None,
+        after: str | None = None,
+        before: str | None = None,
+    ):
+        """Retrieves students ordered by order_by, optionally one keyset page
+        after/before a student_number cursor."""
+
+    @abstractmethod
+    async def find_students(
+        self,
+        user_id: int,
+        query: str,
+        order_by: str = "student_number",
+        mode: str = "substring",
+        limit: int | None = None,
+    ):
+        """Finds students by number or name; mode is "substring", "similarity"
+        or "fulltext"."""
+
+    @abstractmethod
+    async def delete_student(self, user_id: int, student_number: str) -> bool:
+        """Deletes a student. Returns True if one was deleted."""
+
+    @abstractmethod
+    async def update_student_name(
+        self, user_id: int, student_number: str, new_name: str
+    ) -> bool:
+        """Renames a student. Returns True if one was updated."""
+
+
+# --- Helpers shared by the backends ---
+
+
+def number_sort_key(number: str) -> int:
+    """Numeric sort key for student_number, matching student_number_key in Postgres."""
+    return int(number) if number.isascii() and number.isdigit() else -1
+
+
+def like_pattern(query: str) -> str:
+    """Builds a lowercase LIKE substring pattern, escaping LIKE wildcards in the query."""
+    escaped = (
+        query.lower()
+        .replace("\\", "\\\\")
+        .replace("%", "\\%")
+        .replace("_", "\\_")
+    )
+    return f"%{escaped}%"
+
+
+def row_sort_key(order_by: str):
+    """Returns a sort key over (number, name) tuples for the given order,
+    with student_number as the tiebreak like the SQL backends."""
+    if order_by == "student_name":
+        return lambda row: (row[1], number_sort_key(row[0]), row[0])
+    return lambda row: (number_sort_key(row[0]), row[0])
+
+
+def word_similarity(query: str, name: str) -> float:
+    """Approximates pg_trgm's word_similarity: how well the query matches the
+    best run of words in name, from 0 to 1."""
+    query = query.lower()
+    words = WORD_RE.findall(name.lower())
+    query_len = len(WORD_RE.findall(query)) or 1
+    best = 0.0
+    for start in range(len(words)):
+        candidate = " ".join(words[start : start + query_len])
+        best = max(best, SequenceMatcher(None, query, candidate).ratio())
+    return best
+
+
+def search_rows(
+    rows,
+    query: str,
+    order_by: str = "student_number",
+    mode: str = "substring",
+    limit: int | None = None,
+) -> list:
+    """Filters and orders (number, name) tuples the way find_students does in SQL."""
+    lowered = query.lower()
+    if mode == "similarity":
+        scored = []
+        for number, name in rows:
+            score = word_similarity(query, name)
+            if number == query or lowered in name.lower() or score >= SIMILARITY_THRESHOLD:
+                scored.append((number != query, -score, name, (number, name)))
+        matches = [row for *_, row in sorted(scored)]
+    elif mode == "fulltext":
+        query_words = set(WORD_RE.findall(lowered))
+        scored = []
+        for number, name in rows:
+            name_words = WORD_RE.findall(name.lower())
+            if number == query or (query_words and query_words <= set(name_words)):
+                # Rank by how much of the name the query covers, like ts_rank favors dense matches
+                density = len(query_words) / (len(name_words) or 1)
+                scored.append((number != query, -density, name, (number, name)))
+        matches = [row for *_, row in sorted(scored)]
+    else:
+        matches = sorted(
+            (row for row in rows if row[0] == query or lowered in row[1].lower()),
+            key=row_sort_key(order_by),
+        )
+    return matches if limit is None else matches[:limit]
+
+
+def create_storage(backend: str | None = None) -> Storage:
+    """Builds the storage backend named by backend, or by STORAGE_BACKEND:
+    "postgres" (default), "sqlite" (file at SQLITE_PATH) or "memory".
+    Imports are lazy, so the sqlite and memory backends don't need the
+    Postgres drivers or DATABASE_URL."""
+    backend = backend or os.getenv("STORAGE_BACKEND", "postgres")
+    if backend == "memory":
+        from memory_storage import MemoryStorage
+
+        return MemoryStorage()
+
+    if backend == "sqlite":
+        from executor_database import ExecutorDatabase
+        from sqlite_database import SQLiteDatabase
+
+        sqlite_path = os.getenv("SQLITE_PATH", "students.db")
+        return ExecutorDatabase(lambda: SQLiteDatabase(sqlite_path))
+
+    if backend != "postgres":
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+    # How handlers reach Postgres:
+    #   "async"    - AsyncDatabase on psycopg 3 (default)
+    #   "executor" - sync Database run in a thread pool (sized by DB_EXECUTOR_WORKERS)
+    db_mode = os.getenv("DB_MODE", "async")
+    if db_mode == "executor":
+        from database import Database
+        from executor_database import DB_EXECUTOR_WORKERS, ExecutorDatabase
+
+        # One pooled connection per worker thread
+        return ExecutorDatabase(
+            lambda: Database(pooled=True, min_size=1, max_size=DB_EXECUTOR_WORKERS)
+        )
+
+    from async_database import AsyncDatabase
+
+    # Run queries through a connection pool (sized by DB_POOL_MIN/DB_POOL_MAX)
+    pooled = os.getenv("DB_POOLED", "true").lower() in ("1", "true", "yes")
+    return AsyncDatabase(pooled=pooled)
@@ -0,0 +1,68 @@
+import asyncio
+
+from telegram.ext import BaseUpdateProcessor
+
+
+# What PTB's semaphore is given: the real limit is applied per update
+# once it's that user's turn (see PerUserUpdateProcessor)
+UNBOUNDED_UPDATES = 2**31 - 1
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently while keeping each user's updates in order.
+
+    At most max_concurrent_updates handlers run at once. Updates from the
+    same user (or chat, for updates without a user) wait on a per-user FIFO
+    lock, so one user's /add and /delete conversation steps never overtake
+    each other, while unrelated users proceed in parallel.
+
+    PTB's own semaphore is made effectively unbounded and the limit is a
+    semaphore of ours, taken after the per-user lock: an update waiting for
+    the same user's previous one doesn't hold a slot, so one user flooding
+    the bot can't starve everyone else.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        # Every update gets a task right away; _slots does the limiting
+        super().__init__(UNBOUNDED_UPDATES)
+        self.max_running_updates = max_concurrent_updates
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._locks = {}  # key -> [asyncio.Lock, number of updates using it]
+
+    @staticmethod
+    def _sequence_key(update):
+        """Which updates must run in order: per user, else per chat, else none."""
+        if not hasattr(update, "effective_user"):
+            return None  # Custom updates put on the queue by the bot itself
+        if update.effective_user:
+            return ("user", update.effective_user.id)
+        if update.effective_chat:
+            return ("chat", update.effective_chat.id)
+        return None
+
+    async def do_process_update(self, update, coroutine) -> None:
+        key = self._sequence_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # asyncio.Lock wakes waiters in FIFO order, so a user's updates
+            # reach the handlers in the order they arrived
+            async with entry[0], self._slots:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]  # Don't keep a lock per user forever
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
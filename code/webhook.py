@@ -0,0 +1,142 @@
+import hmac
+import json
+
+import uvicorn
+from telegram import Update
+from telegram.ext import Application
+
+
+# Header Telegram sends with the secret_token given to setWebhook
+SECRET_TOKEN_HEADER = b"x-telegram-bot-api-secret-token"
+# Updates are small JSON documents; refuse anything suspiciously large
+MAX_UPDATE_BODY_SIZE = 1024 * 1024
+
+
+class WebhookApp:
+    """Minimal ASGI app that feeds Telegram webhook updates to an Application.
+
+    POST <path> with the right secret token header puts the update on the
+    application's update queue and answers 200 right away; the update is
+    processed like a polled one. GET /healthz answers 200 for load balancer
+    health checks. Everything else is 404.
+    """
+
+    def __init__(self, app: Application, path: str, secret_token: str):
+        self.app = app
+        self.path = path
+        self.secret_token = secret_token.encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return  # Lifespan is driven by run_webhook, not the server
+
+        if scope["method"] == "GET" and scope["path"] == "/healthz":
+            await self._respond(send, 200, b"ok")
+            return
+        if scope["path"] != self.path:
+            await self._respond(send, 404, b"not found")
+            return
+        if scope["method"] != "POST":
+            await self._respond(send, 405, b"method not allowed")
+            return
+
+        headers = dict(scope["headers"])
+        token = headers.get(SECRET_TOKEN_HEADER, b"")
+        if not hmac.compare_digest(token, self.secret_token):
+            await self._respond(send, 403, b"forbidden")
+            return
+
+        body = await self._read_body(receive)
+        if body is None:
+            await self._respond(send, 413, b"payload too large")
+            return
+        try:
+            update = Update.de_json(json.loads(body), self.app.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            print(f"Rejected malformed webhook update: {e}")
+            await self._respond(send, 400, b"bad request")
+            return
+
+        await self.app.update_queue.put(update)
+        await self._respond(send, 200, b"ok")
+
+    @staticmethod
+    async def _read_body(receive) -> bytes | None:
+        """Reads the request body, or returns None if it exceeds MAX_UPDATE_BODY_SIZE."""
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if len(body) > MAX_UPDATE_BODY_SIZE:
+                return None
+            if not message.get("more_body", False):
+                return body
+
+    @staticmethod
+    async def _respond(send, status: int, body: bytes):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"text/plain"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+async def run_webhook(
+    app: Application,
+    url: str,
+    secret_token: str,
+    host: str = "0.0.0.0",
+    port: int = 8443,
+    path: str = "/telegram",
+    max_connections: int = 40,
+):
+    """Runs the bot behind an embedded uvicorn server until it gets SIGINT/SIGTERM.
+
+    url is the public base URL Telegram should call (without path). Unlike
+    run_polling, this drives the Application's lifecycle by hand, so it also
+    calls the post_init/post_shutdown hooks.
+
+    Run exactly one instance. Conversation states (persistence is only read
+    at startup), the roster, page, inline and message-hash caches, roster
+    versions and per-user update ordering all live in this process, so
+    behind a load balancer one user's /add steps could reach instances that
+    don't know about each other.
+    """
+    server = uvicorn.Server(
+        uvicorn.Config(
+            WebhookApp(app, path, secret_token),
+            host=host,
+            port=port,
+            lifespan="off",
+            log_level="warning",
+        )
+    )
+
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    try:
+        # Re-registering on every start is idempotent; a restart keeps the URL
+        await app.bot.set_webhook(
+            url=url.rstrip("/") + path,
+            secret_token=secret_token,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=max_connections,
+        )
+        await app.start()
+        print(f"Bot is running (webhook on {host}:{port}{path})...")
+        await server.serve()
+    finally:
+        if app.running:
+            await app.stop()
+        if app.post_stop:
+            await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+
+# The bot's modules import each other by bare name from code/
+CODE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "code")
+sys.path.insert(0, CODE_DIR)
+
+# User ids the tests write under; the suite cleans up after itself, but
+# keeping them far from real Telegram ids makes a shared database safe
+TEST_USER_ID = 9_000_000_001
+
+
+def import_bot():
+    """Imports bot.py for its pure helpers, skipping without its dependencies.
+    bot.py refuses to load without TELEGRAM_TOKEN, so a dummy one is set."""
+    for module in ("telegram", "dotenv", "uvicorn"):
+        pytest.importorskip(module)
+    os.environ.setdefault("TELEGRAM_TOKEN", "123456:test")
+    import bot
+
+    return bot
+
+
+def require_postgres():
+    """Skips the test unless DATABASE_URL points at a Postgres to test against."""
+    if not os.getenv("DATABASE_URL"):
+        pytest.skip("DATABASE_URL is not set")
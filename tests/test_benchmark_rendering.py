@@ -0,0 +1,95 @@
+"""Rendering microbenchmarks (pytest-benchmark). Run with
+python -m pytest tests/test_benchmark_rendering.py --benchmark-only"""
+
+import types
+
+import pytest
+
+from cache import RosterCache
+from conftest import import_bot
+
+
+pytest.importorskip("pytest_benchmark")
+bot = import_bot()
+
+SIZES = [10, 1_000, 50_000]
+ROSTER_SIZE = 5_000
+
+
+def make_students(count: int) -> list:
+    # Names with a few MarkdownV2 special characters, like real ones have
+    return [
+        {"student_number": str(i), "student_name": f"Student-{i} (group_{i % 7}.)"}
+        for i in range(1, count + 1)
+    ]
+
+
+@pytest.mark.parametrize("count", SIZES)
+def test_escape_markdown(benchmark, count):
+    names = [student["student_name"] for student in make_students(count)]
+
+    escaped = benchmark(lambda: [bot.escape_markdown(name) for name in names])
+    assert len(escaped) == count
+
+
+@pytest.mark.parametrize("count", SIZES)
+def test_format_student_list(benchmark, count):
+    students = make_students(count)
+
+    message_text, reply_markup = benchmark(
+        bot.format_student_list, students, "student_number", has_next=True
+    )
+    assert message_text.count("\n") >= count
+    assert reply_markup is not None
+
+
+def roster_pages() -> list:
+    """Every /list page of a ROSTER_SIZE roster in both sort orders, as
+    (sort_order, page_start, students) in the order a user would page them."""
+    students = make_students(ROSTER_SIZE)
+    by_name = sorted(students, key=lambda student: student["student_name"])
+    pages = []
+    for sort_order, rows in (("student_number", students), ("student_name", by_name)):
+        for start in range(0, ROSTER_SIZE, bot.LIST_PAGE_SIZE):
+            pages.append((sort_order, start + 1, rows[start : start + bot.LIST_PAGE_SIZE]))
+    return pages
+
+
+def render_all(context, pages, version):
+    return [
+        bot.render_student_list(
+            context,
+            1,
+            version,
+            ("snapshot", sort_order),
+            students,
+            sort_order,
+            page_start=page_start,
+            has_prev=page_start > 1,
+            has_next=page_start + len(students) <= ROSTER_SIZE,
+        )
+        for sort_order, page_start, students in pages
+    ]
+
+
+def make_context(pages) -> types.SimpleNamespace:
+    return types.SimpleNamespace(bot_data={"pages": RosterCache(max_size=len(pages))})
+
+
+def test_roster_pages_uncached(benchmark):
+    pages = roster_pages()
+    context = make_context(pages)
+
+    # version None bypasses the page cache, i.e. format_student_list every time
+    rendered = benchmark(render_all, context, pages, None)
+    assert len(rendered) == len(pages)
+
+
+def test_roster_pages_cached(benchmark):
+    pages = roster_pages()
+    context = make_context(pages)
+    expected = render_all(context, pages, 1)  # Warms the cache
+
+    rendered = benchmark(render_all, context, pages, 1)
+    assert rendered == expected
+    assert context.bot_data["pages"].stats()["hits"] >= len(pages)
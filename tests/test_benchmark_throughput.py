@@ -0,0 +1,112 @@
+"""How many concurrent updates per second get through with injected query
+latency, when handlers call a blocking database inline (as they used to call
+the psycopg2 Database) versus awaiting a non-blocking one.
+
+The SQLite pair runs everywhere; the Postgres pair (Database vs
+AsyncDatabase, latency injected with pg_sleep) needs DATABASE_URL.
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from conftest import TEST_USER_ID, require_postgres
+from executor_database import ExecutorDatabase
+from sqlite_database import SQLiteDatabase
+
+
+# Injected per-query latency, concurrent updates sent, and connections/threads
+QUERY_LATENCY = 0.05
+UPDATES = 20
+WORKERS = 10
+
+
+async def blocking_handler(db):
+    db.get_students(TEST_USER_ID)  # A sync call inside async def blocks the event loop
+
+
+async def async_handler(db):
+    await db.get_students(TEST_USER_ID)
+
+
+async def throughput(handler, db) -> float:
+    """Runs UPDATES handlers concurrently and returns updates per second."""
+    start = time.perf_counter()
+    await asyncio.gather(*(handler(db) for _ in range(UPDATES)))
+    return UPDATES / (time.perf_counter() - start)
+
+
+def report(name: str, before: float, after: float):
+    print(
+        f"\n{name}, {UPDATES} concurrent updates, {QUERY_LATENCY * 1000:.0f} ms per query: "
+        f"{before:.0f}/s blocking, {after:.0f}/s non-blocking"
+    )
+
+
+class SlowSQLiteDatabase(SQLiteDatabase):
+    """SQLiteDatabase whose reads take QUERY_LATENCY longer, like a remote database."""
+
+    def get_students(self, *args, **kwargs):
+        time.sleep(QUERY_LATENCY)
+        return super().get_students(*args, **kwargs)
+
+
+def test_sqlite_throughput(tmp_path):
+    path = str(tmp_path / "students.db")
+
+    async def main():
+        blocking = SlowSQLiteDatabase(path)
+        try:
+            before = await throughput(blocking_handler, blocking)
+        finally:
+            blocking.close()
+
+        executor = ExecutorDatabase(lambda: SlowSQLiteDatabase(path), workers=WORKERS)
+        await executor.connect()
+        try:
+            after = await throughput(async_handler, executor)
+        finally:
+            await executor.close()
+        return before, after
+
+    before, after = asyncio.run(main())
+    report("SQLite", before, after)
+    assert after > 4 * before
+
+
+def test_postgres_throughput():
+    require_postgres()
+    pytest.importorskip("psycopg")
+    pytest.importorskip("psycopg2")
+    from async_database import AsyncDatabase
+    from database import Database
+
+    class SlowDatabase(Database):
+        def _execute(self, cur, query, params=None):
+            cur.execute("SELECT pg_sleep(%s)", (QUERY_LATENCY,))
+            super()._execute(cur, query, params)
+
+    class SlowAsyncDatabase(AsyncDatabase):
+        async def _execute(self, cur, query, params=None):
+            await cur.execute("SELECT pg_sleep(%s)", (QUERY_LATENCY,))
+            await super()._execute(cur, query, params)
+
+    async def main():
+        blocking = SlowDatabase(pooled=True, min_size=WORKERS, max_size=WORKERS)
+        try:
+            before = await throughput(blocking_handler, blocking)
+        finally:
+            blocking.close()
+
+        db = SlowAsyncDatabase(pooled=True, min_size=WORKERS, max_size=WORKERS)
+        await db.connect()
+        try:
+            after = await throughput(async_handler, db)
+        finally:
+            await db.close()
+        return before, after
+
+    before, after = asyncio.run(main())
+    report("Postgres", before, after)
+    assert after > 4 * before
@@ -0,0 +1,108 @@
+import asyncio
+import types
+
+from cache import CachedDatabase, RosterCache
+from conftest import TEST_USER_ID, import_bot
+from memory_storage import MemoryStorage
+
+
+bot = import_bot()
+
+
+def run_add_bulk(text: str) -> tuple[str, list]:
+    """Runs add_bulk on text against a MemoryStorage; returns the reply and the roster."""
+    replies = []
+
+    async def reply_text(message, **kwargs):
+        replies.append(message)
+
+    db = MemoryStorage()
+    update = types.SimpleNamespace(
+        effective_user=types.SimpleNamespace(id=TEST_USER_ID),
+        message=types.SimpleNamespace(reply_text=reply_text),
+    )
+    context = types.SimpleNamespace(bot_data={"db": db})
+
+    async def main():
+        await bot.add_bulk(update, context, text)
+        return await db.get_students(TEST_USER_ID)
+
+    rows = asyncio.run(main())
+    return replies[0], [(row["student_number"], row["student_name"]) for row in rows]
+
+
+def test_add_bulk_reports_students_written():
+    reply, rows = run_add_bulk("1 A\n2 B")
+    assert reply == "Added or updated 2 student(s)."
+    assert rows == [("1", "A"), ("2", "B")]
+
+
+def test_add_bulk_reports_overridden_duplicates():
+    reply, rows = run_add_bulk("1 A\n2 B\n1 C")
+    assert reply.startswith("Added or updated 2 student(s). 1 line(s) repeated")
+    assert rows == [("1", "C"), ("2", "B")]
+
+
+def test_add_bulk_reports_rejected_lines():
+    reply, rows = run_add_bulk("1 A\nx B\n3")
+    assert reply.startswith("Added or updated 1 student(s).\n\nSkipped 2 line(s):")
+    assert rows == [("1", "A")]
+
+
+def test_add_bulk_reply_stays_under_message_limit():
+    text = "x\n" * 2000 + ("9" * 5000) + "\n" + "1 A"
+    reply, rows = run_add_bulk(text)
+    assert len(reply) < 4096
+    assert "Skipped 2001 line(s)" in reply
+    assert reply.endswith("...and 1981 more")
+    assert rows == [("1", "A")]
+
+
+def test_add_bulk_rejects_over_long_numbers():
+    reply, rows = run_add_bulk("1 A\n" + "9" * 40 + " B")
+    assert "is longer than 32 digits" in reply
+    assert rows == [("1", "A")]
+
+
+def test_page_buttons_fit_callback_data_limit():
+    students = [
+        {"student_number": "1", "student_name": "A"},
+        {"student_number": "9" * 60, "student_name": "Stored before the length limit"},
+    ]
+    _, reply_markup = bot.format_student_list(
+        students, "student_name", page_start=9_999_951, has_prev=True, has_next=True
+    )
+    prev_data, next_data = (
+        button.callback_data for button in reply_markup.inline_keyboard[-1]
+    )
+    assert prev_data == "list_page:name:prev:9999901:1"
+    # The cursor is left out rather than exceeding Telegram's 64 bytes
+    assert next_data == "list_page:name:next:9999953:"
+
+
+def test_page_callback_data_with_longest_number():
+    callback_data = bot.page_callback_data("name-r", "prev", 9_999_999, "9" * 32)
+    assert callback_data.endswith("9" * 32)
+    assert len(callback_data.encode()) <= bot.CALLBACK_DATA_LIMIT
+
+
+def test_db_stats_says_when_not_pooled(monkeypatch):
+    monkeypatch.setattr(bot, "ADMIN_USER_IDS", {TEST_USER_ID})
+    replies = []
+
+    async def reply_text(message, **kwargs):
+        replies.append(message)
+
+    update = types.SimpleNamespace(
+        effective_user=types.SimpleNamespace(id=TEST_USER_ID),
+        message=types.SimpleNamespace(reply_text=reply_text),
+    )
+    context = types.SimpleNamespace(
+        bot_data={"db": CachedDatabase(MemoryStorage()), "pages": RosterCache()}
+    )
+    asyncio.run(bot.db_stats(update, context))
+
+    lines = replies[0].splitlines()
+    assert lines[:2] == ["Database stats:", "Database is not running in pooled mode."]
+    assert "cache_hits: 0" in lines
+    assert "page_cache_hits: 0" in lines
@@ -0,0 +1,37 @@
+from importer import MAX_NUMBER_LENGTH, clean_rows, is_valid_number, take_batch
+
+
+def test_clean_rows_skips_header_and_rejects_bad_rows():
+    stats = {}
+    rows = list(
+        clean_rows(
+            [
+                ("student_number", "student_name"),
+                (1, "A"),
+                (2.0, "B"),  # XLSX gives numbers as floats
+                ("x", "C"),
+                ("3", ""),
+                ("9" * (MAX_NUMBER_LENGTH + 1), "Too long"),
+                (),
+            ],
+            stats,
+        )
+    )
+    assert rows == [("1", "A"), ("2", "B")]
+    assert stats == {"accepted": 2, "rejected": 3}
+
+
+def test_is_valid_number():
+    assert is_valid_number("007")
+    assert is_valid_number("9" * MAX_NUMBER_LENGTH)
+    assert not is_valid_number("9" * (MAX_NUMBER_LENGTH + 1))
+    assert not is_valid_number("")
+    assert not is_valid_number("12a")
+
+
+def test_take_batch():
+    rows = iter(range(5))
+    assert take_batch(rows, 2) == [0, 1]
+    assert take_batch(rows, 2) == [2, 3]
+    assert take_batch(rows, 2) == [4]
+    assert take_batch(rows, 2) == []
@@ -0,0 +1,80 @@
+"""Checks that /list reads its pages with index-only scans in both sort
+orders. Postgres only: needs DATABASE_URL."""
+
+import json
+
+import pytest
+
+from conftest import TEST_USER_ID, require_postgres
+
+
+# Synthetic dataset: many users with mid-sized rosters, so the planner
+# prefers the per-user indexes over scanning the table
+USERS = 200
+ROSTER_SIZE = 500
+FIRST_USER = TEST_USER_ID + 1000
+# What /list asks for: LIST_PAGE_SIZE in bot.py, plus one to tell whether there's a next page
+PAGE_LIMIT = 51
+
+INSERT_SYNTHETIC = """
+    INSERT INTO students (user_id, student_number, student_name)
+    SELECT user_id, n::text, initcap(md5(user_id::text || n::text))
+    FROM generate_series(%s, %s) AS user_id, generate_series(1, %s) AS n
+"""
+
+DELETE_SYNTHETIC = "DELETE FROM students WHERE user_id BETWEEN %s AND %s"
+
+
+@pytest.fixture(scope="module")
+def conn():
+    require_postgres()
+    psycopg2 = pytest.importorskip("psycopg2")
+    from database import DATABASE_URL
+    from migrate import migrate
+
+    migrate(DATABASE_URL)
+    conn = psycopg2.connect(DATABASE_URL)
+    conn.autocommit = True  # VACUUM can't run in a transaction
+    last_user = FIRST_USER + USERS - 1
+    try:
+        with conn.cursor() as cur:
+            cur.execute(DELETE_SYNTHETIC, (FIRST_USER, last_user))
+            cur.execute(INSERT_SYNTHETIC, (FIRST_USER, last_user, ROSTER_SIZE))
+            # Index-only scans need the visibility map set, and fresh statistics
+            cur.execute("VACUUM ANALYZE students")
+        yield conn
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(DELETE_SYNTHETIC, (FIRST_USER, last_user))
+        conn.close()
+
+
+def main_plan_nodes(plan: dict):
+    """Yields the plan's nodes, leaving out InitPlans and SubPlans (the
+    keyset cursor lookup, which is a primary key probe)."""
+    yield plan
+    for child in plan.get("Plans", []):
+        if child.get("Parent Relationship") not in ("InitPlan", "SubPlan"):
+            yield from main_plan_nodes(child)
+
+
+@pytest.mark.parametrize("order_by", ["student_number", "student_name"])
+@pytest.mark.parametrize("cursor", [None, "after", "before"])
+def test_list_page_is_index_only_scan(conn, order_by, cursor):
+    from database import build_students_query
+
+    kwargs = {cursor: "250"} if cursor else {}
+    sql_query, params, _ = build_students_query(
+        FIRST_USER + USERS // 2, order_by=order_by, limit=PAGE_LIMIT, **kwargs
+    )
+    with conn.cursor() as cur:
+        cur.execute("EXPLAIN (FORMAT JSON) " + sql_query, params)
+        explained = cur.fetchone()[0]
+    if isinstance(explained, str):
+        explained = json.loads(explained)
+    plan = explained[0]
+
+    node_types = [node["Node Type"] for node in main_plan_nodes(plan["Plan"])]
+    assert "Index Only Scan" in node_types, json.dumps(plan, indent=2)
+    assert "Sort" not in node_types, json.dumps(plan, indent=2)
+    assert "Seq Scan" not in node_types, json.dumps(plan, indent=2)
@@ -0,0 +1,57 @@
+"""PostgresPersistence round trip. Postgres only: needs DATABASE_URL."""
+
+import asyncio
+
+import pytest
+
+from conftest import TEST_USER_ID, require_postgres
+
+
+@pytest.fixture
+def persistence_class():
+    require_postgres()
+    pytest.importorskip("psycopg")
+    pytest.importorskip("psycopg2")  # migrate.py runs the migrations with it
+    pytest.importorskip("telegram")
+    from persistence import PostgresPersistence
+
+    return PostgresPersistence
+
+
+def test_user_data_loads_lazily_per_user(persistence_class):
+    async def main():
+        writer = persistence_class()
+        await writer.update_user_data(TEST_USER_ID, {"list_sort_order": "student_name"})
+        await writer.flush()
+
+        reader = persistence_class()
+        try:
+            at_startup = await reader.get_user_data()
+            user_data = {"temp_number": "7"}  # Set before the first load
+            await reader.refresh_user_data(TEST_USER_ID, user_data)
+            first = dict(user_data)
+            user_data["list_sort_order"] = "student_number"
+            await reader.refresh_user_data(TEST_USER_ID, user_data)
+            return at_startup, first, user_data
+        finally:
+            await reader.drop_user_data(TEST_USER_ID)
+            await reader.flush()
+
+    at_startup, first, again = asyncio.run(main())
+    assert at_startup == {}
+    assert first == {"temp_number": "7", "list_sort_order": "student_name"}
+    # Loaded once: later refreshes leave the in-memory data alone
+    assert again["list_sort_order"] == "student_number"
+
+
+def test_unknown_user_loads_nothing(persistence_class):
+    async def main():
+        persistence = persistence_class()
+        user_data = {}
+        try:
+            await persistence.refresh_user_data(TEST_USER_ID + 1, user_data)
+        finally:
+            await persistence.flush()
+        return user_data
+
+    assert asyncio.run(main()) == {}
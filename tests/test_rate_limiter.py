@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("telegram")
+from rate_limiter import OutgoingRateLimiter
+
+
+def gauges(limiter) -> dict:
+    return {name: samples[0][1] for name, _, _, samples in limiter._collect()}
+
+
+def test_queue_gauges_follow_requests():
+    async def main():
+        limiter = OutgoingRateLimiter()
+        release = asyncio.Event()
+        seen = []
+
+        async def send():
+            await release.wait()
+
+        requests = [
+            asyncio.create_task(
+                limiter.process_request(
+                    send, (), {}, "sendMessage", {"chat_id": chat_id}, 0
+                )
+            )
+            for chat_id in (1, 1, 2)
+        ]
+        await asyncio.sleep(0.01)
+        seen.append(gauges(limiter))
+        release.set()
+        await asyncio.gather(*requests)
+        seen.append(gauges(limiter))
+        return seen
+
+    queued, done = asyncio.run(main())
+    assert queued == {"bot_outgoing_queue_depth": 3, "bot_outgoing_queued_chats": 2}
+    assert done == {"bot_outgoing_queue_depth": 0, "bot_outgoing_queued_chats": 0}
@@ -0,0 +1,38 @@
+import pytest
+
+from conftest import import_bot
+
+
+bot = import_bot()
+
+OLD_ESCAPE_CHARS = r"_*[]()~`>#+-=|{}.!"
+
+
+def old_escape_markdown(text) -> str:
+    """escape_markdown as it was before the translation table."""
+    return "".join(
+        f"\\{char}" if char in OLD_ESCAPE_CHARS else char for char in str(text)
+    )
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "plain text",
+        OLD_ESCAPE_CHARS,
+        "a\\b",  # Backslashes are left alone
+        "O'Brien-Smith (2nd).",
+        "Ünïcödé ✅ 名前",
+        "x" * 10_000 + "!",
+        42,
+        -1.5,
+    ],
+)
+def test_escape_markdown_matches_old_implementation(text):
+    assert bot.escape_markdown(text) == old_escape_markdown(text)
+
+
+def test_escape_markdown_every_ascii_char():
+    text = "".join(map(chr, range(128)))
+    assert bot.escape_markdown(text) == old_escape_markdown(text)
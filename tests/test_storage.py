@@ -0,0 +1,250 @@
+"""Conformance suite every storage backend must pass.
+
+Runs against MemoryStorage and SQLiteDatabase (through ExecutorDatabase,
+the way create_storage builds it) everywhere, and against AsyncDatabase
+when DATABASE_URL is set.
+"""
+
+import asyncio
+import io
+
+import pytest
+
+from conftest import TEST_USER_ID, require_postgres
+from executor_database import ExecutorDatabase
+from memory_storage import MemoryStorage
+from sqlite_database import SQLiteDatabase
+
+
+ROSTER = [
+    ("10", "Boris Godunov"),
+    ("2", "Anna Karenina"),
+    ("100", "Dmitri Karamazov"),
+    ("A1", "Chichikov Pavel"),
+]
+
+
+@pytest.fixture(params=["memory", "sqlite", "postgres"])
+def make_storage(request, tmp_path):
+    """Returns a factory for an unconnected backend of each kind."""
+    if request.param == "memory":
+        return MemoryStorage
+    if request.param == "sqlite":
+        path = str(tmp_path / "students.db")
+        return lambda: ExecutorDatabase(lambda: SQLiteDatabase(path), workers=2)
+    require_postgres()
+    pytest.importorskip("psycopg")
+    pytest.importorskip("psycopg2")  # migrate.py runs the migrations with it
+    from async_database import AsyncDatabase
+
+    return AsyncDatabase
+
+
+def run(make_storage, scenario):
+    """Runs scenario(db) on a fresh, connected backend with an empty roster
+    for TEST_USER_ID, and leaves the roster empty afterwards."""
+
+    async def clear(db):
+        for row in await db.get_students(TEST_USER_ID):
+            await db.delete_student(TEST_USER_ID, row["student_number"])
+
+    async def main():
+        db = make_storage()
+        await db.connect()
+        try:
+            await clear(db)
+            return await scenario(db)
+        finally:
+            await clear(db)
+            await db.close()
+
+    return asyncio.run(main())
+
+
+def numbers(rows) -> list:
+    return [row["student_number"] for row in rows]
+
+
+def test_orders_numbers_numerically(make_storage):
+    async def scenario(db):
+        await db.add_students_bulk(TEST_USER_ID, ROSTER)
+        return await db.get_students(TEST_USER_ID)
+
+    # Non-numeric numbers sort first, then "2" before "10"
+    assert numbers(run(make_storage, scenario)) == ["A1", "2", "10", "100"]
+
+
+def test_orders_by_name(make_storage):
+    async def scenario(db):
+        await db.add_students_bulk(TEST_USER_ID, ROSTER)
+        return await db.get_students(TEST_USER_ID, order_by="student_name")
+
+    assert numbers(run(make_storage, scenario)) == ["2", "10", "A1", "100"]
+
+
+@pytest.mark.parametrize(
+    "order_by, expected",
+    [
+        ("student_number", ["A1", "2", "10", "100"]),
+        ("student_name", ["2", "10", "A1", "100"]),
+    ],
+)
+def test_keyset_pages(make_storage, order_by, expected):
+    async def scenario(db):
+        await db.add_students_bulk(TEST_USER_ID, ROSTER)
+        first = await db.get_students(TEST_USER_ID, order_by=order_by, limit=2)
+        second = await db.get_students(
+            TEST_USER_ID, order_by=order_by, limit=2, after=first[-1]["student_number"]
+        )
+        back = await db.get_students(
+            TEST_USER_ID, order_by=order_by, limit=2, before=second[0]["student_number"]
+        )
+        past_end = await db.get_students(
+            TEST_USER_ID, order_by=order_by, limit=2, after=second[-1]["student_number"]
+        )
+        return first, second, back, past_end
+
+    first, second, back, past_end = run(make_storage, scenario)
+    assert numbers(first) == expected[:2]
+    assert numbers(second) == expected[2:]
+    # A page before a cursor comes back in display order, not reversed
+    assert numbers(back) == expected[:2]
+    assert past_end == []
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("kar", ["2", "100"]),  # Substring of a name, case-insensitive
+        ("10", ["10"]),  # Exact number only, not "100"
+        ("%", []),  # LIKE wildcards are matched literally
+        ("zzz", []),
+    ],
+)
+def test_substring_search(make_storage, query, expected):
+    async def scenario(db):
+        await db.add_students_bulk(TEST_USER_ID, ROSTER)
+        return await db.find_students(TEST_USER_ID, query)
+
+    assert numbers(run(make_storage, scenario)) == expected
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("Borris", ["10"]),  # Typo in a name
+        ("Karamazof", ["100"]),
+        ("2", ["2"]),  # Exact number
+    ],
+)
+def test_similarity_search(make_storage, query, expected):
+    async def scenario(db):
+        await db.add_students_bulk(TEST_USER_ID, ROSTER)
+        return await db.find_students(TEST_USER_ID, query, mode="similarity")
+
+    assert numbers(run(make_storage, scenario))[: len(expected)] == expected
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("anna karenina", ["2"]),
+        ("Karenina Anna", ["2"]),  # Word order doesn't matter
+        ("anna godunov", []),  # Every word must match
+        ("A1", ["A1"]),  # Exact number
+    ],
+)
+def test_fulltext_search(make_storage, query, expected):
+    async def scenario(db):
+        await db.add_students_bulk(TEST_USER_ID, ROSTER)
+        return await db.find_students(TEST_USER_ID, query, mode="fulltext")
+
+    assert numbers(run(make_storage, scenario)) == expected
+
+
+def test_search_limit(make_storage):
+    async def scenario(db):
+        await db.add_students_bulk(TEST_USER_ID, ROSTER)
+        return await db.find_students(TEST_USER_ID, "a", limit=2)
+
+    assert len(run(make_storage, scenario)) == 2
+
+
+def test_bulk_upsert_collapses_duplicates(make_storage):
+    async def scenario(db):
+        await db.add_student(TEST_USER_ID, "2", "Old Name")
+        written = await db.add_students_bulk(
+            TEST_USER_ID, [("1", "A"), ("2", "B"), ("1", "C")]
+        )
+        return written, await db.get_students(TEST_USER_ID)
+
+    written, rows = run(make_storage, scenario)
+    assert written == 2
+    # Later duplicates win, existing numbers are updated
+    assert [(row["student_number"], row["student_name"]) for row in rows] == [
+        ("1", "C"),
+        ("2", "B"),
+    ]
+
+
+def test_import_counts(make_storage):
+    async def scenario(db):
+        await db.add_students_bulk(TEST_USER_ID, [("1", "A"), ("2", "B")])
+        counts = await db.import_students(
+            TEST_USER_ID, iter([("2", "B2"), ("3", "C"), ("3", "C2")])
+        )
+        return counts, await db.get_students(TEST_USER_ID)
+
+    counts, rows = run(make_storage, scenario)
+    assert counts == {"inserted": 1, "updated": 1}
+    assert [(row["student_number"], row["student_name"]) for row in rows] == [
+        ("1", "A"),
+        ("2", "B2"),
+        ("3", "C2"),
+    ]
+
+
+def test_export_csv(make_storage):
+    async def scenario(db):
+        await db.add_students_bulk(TEST_USER_ID, [("10", "Doe, Jane"), ("2", "B")])
+        out = io.BytesIO()
+        await db.export_students(TEST_USER_ID, out)
+        return out.getvalue().decode("utf-8")
+
+    assert run(make_storage, scenario).splitlines() == [
+        "student_number,student_name",
+        "2,B",
+        '10,"Doe, Jane"',
+    ]
+
+
+def test_delete_and_rename_report_missing_students(make_storage):
+    async def scenario(db):
+        await db.add_student(TEST_USER_ID, "1", "A")
+        return (
+            await db.update_student_name(TEST_USER_ID, "1", "B"),
+            await db.update_student_name(TEST_USER_ID, "9", "B"),
+            await db.get_students(TEST_USER_ID),
+            await db.delete_student(TEST_USER_ID, "1"),
+            await db.delete_student(TEST_USER_ID, "1"),
+        )
+
+    renamed, missing_rename, rows, deleted, missing_delete = run(make_storage, scenario)
+    assert (renamed, missing_rename) == (True, False)
+    assert rows[0]["student_name"] == "B"
+    assert (deleted, missing_delete) == (True, False)
+
+
+def test_rosters_are_per_user(make_storage):
+    other_user = TEST_USER_ID + 1
+
+    async def scenario(db):
+        await db.add_student(TEST_USER_ID, "1", "A")
+        try:
+            await db.add_student(other_user, "1", "Other")
+            return await db.get_students(TEST_USER_ID)
+        finally:
+            await db.delete_student(other_user, "1")
+
+    rows = run(make_storage, scenario)
+    assert [row["student_name"] for row in rows] == ["A"]
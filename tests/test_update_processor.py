@@ -0,0 +1,120 @@
+import asyncio
+import time
+import types
+
+import pytest
+
+pytest.importorskip("telegram")
+from update_processor import PerUserUpdateProcessor
+
+
+# Simulated database latency per handler, and the load the test sends
+DB_LATENCY = 0.05
+USERS = 8
+UPDATES_PER_USER = 3
+
+
+def make_update(user_id: int):
+    return types.SimpleNamespace(
+        effective_user=types.SimpleNamespace(id=user_id), effective_chat=None
+    )
+
+
+async def run_load(max_concurrent_updates: int) -> tuple[float, dict, PerUserUpdateProcessor]:
+    """Sends UPDATES_PER_USER updates for each of USERS users, interleaved,
+    through the processor. Returns the elapsed time, the order each user's
+    handlers finished in, and the processor."""
+    processor = PerUserUpdateProcessor(max_concurrent_updates)
+    finished = {user_id: [] for user_id in range(USERS)}
+
+    async def handler(user_id: int, seq: int):
+        await asyncio.sleep(DB_LATENCY)
+        finished[user_id].append(seq)
+
+    start = time.perf_counter()
+    tasks = [
+        asyncio.create_task(
+            processor.process_update(make_update(user_id), handler(user_id, seq))
+        )
+        for seq in range(UPDATES_PER_USER)
+        for user_id in range(USERS)
+    ]
+    await asyncio.gather(*tasks)
+    return time.perf_counter() - start, finished, processor
+
+
+def test_concurrent_processing_throughput():
+    sequential, _, _ = asyncio.run(run_load(1))
+    concurrent, finished, processor = asyncio.run(run_load(USERS * UPDATES_PER_USER))
+
+    updates = USERS * UPDATES_PER_USER
+    print(
+        f"\n{updates} updates, {DB_LATENCY * 1000:.0f} ms each: "
+        f"{updates / sequential:.0f}/s sequential, {updates / concurrent:.0f}/s concurrent"
+    )
+    # One user's updates still take turns, so the best case is UPDATES_PER_USER
+    # latencies instead of all of them
+    assert concurrent < sequential / 4
+    assert concurrent >= UPDATES_PER_USER * DB_LATENCY
+    for order in finished.values():
+        assert order == list(range(UPDATES_PER_USER))
+    assert processor._locks == {}  # Per-user locks are dropped once idle
+
+
+def test_same_user_never_overlaps():
+    async def main():
+        processor = PerUserUpdateProcessor(16)
+        running = 0
+        overlaps = 0
+
+        async def handler():
+            nonlocal running, overlaps
+            running += 1
+            overlaps += running > 1
+            await asyncio.sleep(0.001)
+            running -= 1
+
+        await asyncio.gather(
+            *(processor.process_update(make_update(1), handler()) for _ in range(20))
+        )
+        return overlaps
+
+    assert asyncio.run(main()) == 0
+
+
+def test_updates_without_user_run_in_parallel():
+    async def main():
+        processor = PerUserUpdateProcessor(16)
+        # Custom updates the bot puts on its own queue have no effective_user
+        updates = [object() for _ in range(10)]
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(
+                processor.process_update(update, asyncio.sleep(DB_LATENCY))
+                for update in updates
+            )
+        )
+        return time.perf_counter() - start
+
+    assert asyncio.run(main()) < 5 * DB_LATENCY
+
+
+def test_flooding_user_does_not_starve_others():
+    async def main():
+        processor = PerUserUpdateProcessor(4)
+        # One user taps Next far faster than their handlers finish
+        flood = [
+            asyncio.create_task(
+                processor.process_update(make_update(1), asyncio.sleep(0.01))
+            )
+            for _ in range(40)
+        ]
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        await processor.process_update(make_update(2), asyncio.sleep(0.001))
+        latency = time.perf_counter() - start
+        await asyncio.gather(*flood)
+        return latency
+
+    # The flooding user runs one handler at a time, leaving slots for others
+    assert asyncio.run(main()) < DB_LATENCY